@@ -1,6 +1,17 @@
-from pyntree.file import File
+from pyntree.file import File, iter_file
 from pyntree.errors import Error
-from typing import Union, Any, List
+from pyntree.shared import Snapshot
+from pyntree.table import Table
+from pyntree import columns, diff
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Union, Any, List, Iterator, Tuple, Callable, Dict, Sequence
+from copy import deepcopy
+import os
+
+EXECUTORS = {
+    "process": ProcessPoolExecutor,
+    "thread": ThreadPoolExecutor
+}
 
 
 class Node(object):
@@ -46,11 +57,11 @@ class Node(object):
         requested = []
         for name in names:
             try:
-                if name not in self():  # If key doesn't exist
+                if name not in self._get():  # If key doesn't exist
                     raise AttributeError(
                         f"<RootNode>.{'.'.join(self.path)}{'.' if self.path else ''}{name} does not exist")
             except TypeError:  # Throw something more descriptive/accurate
-                raise Error.NotANode(f"<RootNode>.{'.'.join(self.path)} is {type(self()).__name__}, not Node.")
+                raise Error.NotANode(f"<RootNode>.{'.'.join(self.path)} is {type(self._get()).__name__}, not Node.")
             requested.append(Node(file=self.file, path=self.path + [name]))
         return requested if len(requested) > 1 else requested[0]  # Don't return a list if only 1 name specified
 
@@ -64,19 +75,29 @@ class Node(object):
             raise TypeError("You must specify at least 1 name and a value for the set method.")
         value = args.pop(-1)
         names = args  # All arguments but last are names
-        target = self()  # Calls the __call__ function to get the target (which is a mutable value)
+        target = self._get()  # The target (which is a mutable value)
         for name in names:
             target[name] = value  # Sets the final target to the desired value
+            self.file.invalidate(*self.path, name)
         if self.file.autosave:
             self.file.save()
 
     def __call__(self) -> Any:
+        target = self._get()
+        if diff.is_mutable(target):  # It may be changed in place, so its cached hashes can't be trusted anymore
+            self.file.invalidate(*self.path)
+        return target
+
+    def _get(self) -> Any:
+        """
+        :return: The Node's value, for use by methods which don't hand it out or change it in place (see __call__)
+        """
         if self.path:  # Root node will have a path equal to []
-            target = self.file.data.get(self.path[0])
+            target = self.file.resolve().get(self.path[0])
             for i in self.path[1:]:  # Iter over all but first
                 target = target.get(i)
         else:
-            target = self.file.data
+            target = self.file.resolve()
         return target
 
     # Representation methods
@@ -84,23 +105,20 @@ class Node(object):
         """
         :return: A string representation of the data contained within the Node
         """
-        return str(self())
+        return str(self._get())
 
     def __repr__(self):
         """
         :return: A string containing the code necessary to replicate the Node
         """
-        if type(self()) is dict:
-            return f'Node({self()})'
+        if type(self._get()) is dict:
+            return f'Node({self._get()})'
         else:
-            return repr(self())
+            return repr(self._get())
 
     def __getstate__(self):  # When pickled
         trim = self.file  # The File object is what contains all the relevant information, even for pure data Nodes.
-        if trim.file:
-            # Remove the '_io.BufferedRandom' object which can't be serialized
-            trim.file.close()
-            trim.file = None
+        trim.load_all()  # Lazily loaded values can't be read by another process
         # Note: The path information will be discarded. This is intentional.
         return trim
 
@@ -126,17 +144,19 @@ class Node(object):
         :return:
         """
         if names:
-            target = self()
+            target = self._get()
             for name in names:
                 target.pop(name)
+                self.file.invalidate(*self.path, name)
         else:
             if self.path:  # Root node will have a path equal to []
-                target = self.file.data
+                target = self.file.resolve()
                 for i in self.path[0:-1]:  # Iter over all but last
                     target = target.get(i)
                 target.pop(self.path[-1])
             else:
                 self.file.data = {}
+            self.file.invalidate(*self.path)
         if self.file.autosave:
             self.file.save()
 
@@ -158,7 +178,8 @@ class Node(object):
         for name in self._values:
             child = self.get(name)
             for kwarg in kwargs:
-                if child.has(kwarg) and child.get(kwarg)() == kwargs[kwarg]:  # Evaluated left to right, so no error
+                # Evaluated left to right, so no error
+                if child.has(kwarg) and child.get(kwarg)._get() == kwargs[kwarg]:
                     matches.append(child)
 
         return matches
@@ -177,6 +198,207 @@ class Node(object):
 
         return matches
 
+    def map(
+            self,
+            fn: Callable[[Any], Any],
+            executor: Union[str, Executor] = 'process',
+            workers: int = None,
+            chunksize: int = None,
+            update: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Calls a function on the value of every child Node in parallel.
+        Only the values are sent to the workers (never the File), and they are sent in chunks to keep the pickling
+        overhead of process pools low.
+        :param fn: The function to call on each value. It must be picklable when using a process pool.
+        :param executor: 'process', 'thread', or an existing Executor to reuse
+        :param workers: The number of workers to start (ignored if an Executor is passed)
+        :param chunksize: The number of values sent to a process at once (default: ~4 chunks per worker)
+        :param update: Replace each child's value with its result, saving once at the end if autosave is on
+        :return: A dictionary of each child's name and result, in the same order as the children
+        """
+        names = self._values
+        target = self._get()
+        values = [target[name] for name in names]
+        results = dict(zip(names, self._run(fn, values, executor, workers, chunksize)))
+        if update:
+            target.update(results)
+        for name, value in zip(names, values):
+            if update or diff.is_mutable(value):  # fn may have changed the value in place
+                self.file.invalidate(*self.path, name)
+        if update:
+            if self.file.autosave:
+                self.file.save()
+        return results
+
+    def filter(
+            self,
+            predicate: Callable[[Any], bool],
+            executor: Union[str, Executor] = 'process',
+            workers: int = None,
+            chunksize: int = None
+    ) -> List['Node']:
+        """
+        Checks the value of every child Node against a predicate in parallel. See map for details on the arguments.
+        :param predicate: The function to call on each value. It must be picklable when using a process pool.
+        :return: A list of the Nodes whose values the predicate returned a truthy value for, in order
+        """
+        results = self.map(predicate, executor=executor, workers=workers, chunksize=chunksize)
+        return [self.get(name) for name, result in results.items() if result]
+
+    @staticmethod
+    def _run(fn, values, executor, workers, chunksize) -> List[Any]:
+        if chunksize is None:  # About 4 chunks per worker, like multiprocessing.Pool.map
+            chunksize = max(1, -(-len(values) // ((workers or os.cpu_count() or 1) * 4)))
+        if isinstance(executor, Executor):
+            return list(executor.map(fn, values, chunksize=chunksize))
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor '{executor}', expected one of {', '.join(EXECUTORS)} or an Executor.")
+        with EXECUTORS[executor](workers) as pool:
+            return list(pool.map(fn, values, chunksize=chunksize))
+
+    # Replication
+    def diff(self, other: Union['Node', Any]) -> List[Tuple]:
+        """
+        Compares two trees by their subtree hashes, only descending into subtrees whose hashes differ. Hashes are
+        cached on each File, and cleared along the path of every change and of every mutable value handed out (which
+        could be changed in place), so diffing again after a few changes only rehashes those paths. If two Files share
+        the same data (e.g. Node(db())), changes made through one aren't seen by the other's cache, so call invalidate
+        on the other File.
+        :param other: The Node (or plain value) to compare against
+        :return: A patch which turns this Node's data into the other's (see apply), empty if they're equal
+        """
+        if not isinstance(other, Node):
+            return diff.diff(self._get(), other, self.file.hash_node(*self.path), diff.HashNode())
+        patch = diff.diff(self._get(), other._get(), self.file.hash_node(*self.path), other.file.hash_node(*other.path))
+        for change in patch:  # The patch hands out the other tree's values
+            if change[0] == diff.SET and diff.is_mutable(change[2]):
+                other.file.invalidate(*other.path, *change[1])
+        return patch
+
+    def apply(self, patch: Union[List[Tuple], bytes]) -> None:
+        """
+        Applies a patch made by diff, saving once at the end if autosave is on
+        :param patch: The patch, or its compact form from pyntree.diff.dumps (which is unpickled, so it must come from
+        a trusted peer)
+        :return:
+        """
+        if type(patch) is bytes:
+            patch = diff.loads(patch)
+        else:  # Don't share mutable values with the tree the patch came from
+            patch = deepcopy(patch)
+        for change in patch:
+            path = self.path + list(change[1])
+            if change[0] == diff.SET and not path:
+                self.file.data = change[2]
+            elif change[0] == diff.SET:
+                self.file.resolve(*path[:-1])[path[-1]] = change[2]
+            elif path:
+                self.file.resolve(*path[:-1]).pop(path[-1])
+            else:
+                self.file.data = {}
+            self.file.invalidate(*path)
+        if self.file.autosave:
+            self.file.save()
+
+    # Columnar operations - for Nodes whose children are records with the same fields
+    def column(self, name: str) -> Sequence:
+        """
+        Extracts one field from every child Node in a single pass.
+        :param name: The field to extract
+        :return: A NumPy array if NumPy is installed, otherwise an array.array (or a list for non-numeric values)
+        """
+        return self.to_columns([name])[name]
+
+    def to_columns(self, names: List[str]) -> Dict[str, Sequence]:
+        """
+        Extracts several fields from every child Node in a single pass.
+        :param names: The fields to extract
+        :return: A dictionary of each field and its column, with one row per child in order (see column)
+        """
+        target = self._get()
+        if isinstance(target, Table):  # Already stored as columns
+            try:
+                extracted = {name: target.column(name) for name in names}
+            except KeyError as e:
+                raise AttributeError(f"<RootNode>.{'.'.join(self.path)}.<record>.{e.args[0]} does not exist")
+            self._invalidate_handed_out(extracted)
+            return {name: columns.to_array(column) for name, column in extracted.items()}
+        extracted = {name: [] for name in names}
+        for child, record in target.items():
+            for name in names:
+                try:
+                    extracted[name].append(record[name])
+                except KeyError:
+                    raise AttributeError(f"<RootNode>.{'.'.join(self.path + [child])}.{name} does not exist")
+                except TypeError:  # Throw something more descriptive/accurate
+                    raise Error.NotANode(
+                        f"<RootNode>.{'.'.join(self.path + [child])} is {type(record).__name__}, not Node.")
+        self._invalidate_handed_out(extracted)
+        return {name: columns.to_array(values) for name, values in extracted.items()}
+
+    def _invalidate_handed_out(self, extracted: Dict[str, Sequence]) -> None:
+        """
+        Clears this Node's cached hashes if any of the extracted values could be changed in place
+        """
+        for column in extracted.values():
+            if isinstance(column, list) and any(diff.is_mutable(value) for value in column):
+                self.file.invalidate(*self.path)
+                return
+
+    def sum(self, name: str) -> Any:
+        """
+        :param name: The field to add up
+        :return: The sum of the field across all child Nodes
+        """
+        return columns.total(self.column(name))
+
+    def mean(self, name: str) -> float:
+        """
+        :param name: The field to average
+        :return: The mean of the field across all child Nodes
+        """
+        return columns.mean(self.column(name))
+
+    def count(self, name: str = None) -> int:
+        """
+        :param name: If set, only count the child Nodes which have this field
+        :return: The number of child Nodes
+        """
+        target = self._get()
+        if name is None:
+            return len(target)
+        if isinstance(target, Table):
+            return len(target) if name in target.schema else 0
+        return sum(1 for record in target.values() if type(record) is dict and name in record)
+
+    def group_by(self, key: str, name: str = None, agg: str = 'sum') -> Dict[Any, Any]:
+        """
+        Aggregates a field of the child Nodes for each distinct value of another field.
+        :param key: The field to group by
+        :param name: The field to aggregate (not needed for 'count')
+        :param agg: 'sum', 'mean' or 'count'
+        :return: A dictionary of each group and its aggregated value, in order of first appearance
+        """
+        if agg == 'count':
+            return columns.group(self.column(key), None, agg)
+        if name is None:
+            raise TypeError("You must specify a field to aggregate unless agg is 'count'.")
+        extracted = self.to_columns([key, name])
+        return columns.group(extracted[key], extracted[name], agg)
+
+    def share(self) -> Snapshot:
+        """
+        Publishes a read-only copy of this Node's data into shared memory. Pass the returned Snapshot (or its name)
+        to other processes and open it there with pyntree.attach, instead of sending them the Node itself.
+        Call close() on the Snapshot once the other processes are done with it to free the memory.
+        :return: The Snapshot which owns the shared memory
+        """
+        try:
+            return Snapshot.publish(self._get())
+        except AttributeError:  # Throw something more descriptive/accurate
+            raise Error.NotANode(f"<RootNode>.{'.'.join(self.path)} is {type(self._get()).__name__}, not Node.")
+
     # Properties
     @property
     def _values(self) -> List[str]:
@@ -184,7 +406,7 @@ class Node(object):
         Returns the list of child Nodes this Node contains
         :return:
         """
-        return list(self().keys())
+        return list(self._get().keys())
 
     @property
     def _children(self) -> List['Node']:
@@ -209,49 +431,82 @@ class Node(object):
 
     # Arithmetic operations - only for child Nodes since the operations don't work on dictionaries anyways
     def __iadd__(self, other):
-        self.file.get_nested(*self.path[:-1])[self.path[-1]] += other
+        self.file.resolve(*self.path[:-1])[self.path[-1]] += other
+        self.file.invalidate(*self.path)
         return self()
 
     def __isub__(self, other):
-        self.file.get_nested(*self.path[:-1])[self.path[-1]] -= other
+        self.file.resolve(*self.path[:-1])[self.path[-1]] -= other
+        self.file.invalidate(*self.path)
         return self()
 
     def __imul__(self, other):
-        self.file.get_nested(*self.path[:-1])[self.path[-1]] *= other
+        self.file.resolve(*self.path[:-1])[self.path[-1]] *= other
+        self.file.invalidate(*self.path)
         return self()
 
     def __itruediv__(self, other):
-        self.file.get_nested(*self.path[:-1])[self.path[-1]] /= other
+        self.file.resolve(*self.path[:-1])[self.path[-1]] /= other
+        self.file.invalidate(*self.path)
         return self()
 
     def __ifloordiv__(self, other):
-        self.file.get_nested(*self.path[:-1])[self.path[-1]] //= other
+        self.file.resolve(*self.path[:-1])[self.path[-1]] //= other
+        self.file.invalidate(*self.path)
         return self()
 
     def __imod__(self, other):
-        self.file.get_nested(*self.path[:-1])[self.path[-1]] %= other
+        self.file.resolve(*self.path[:-1])[self.path[-1]] %= other
+        self.file.invalidate(*self.path)
         return self()
 
     def __ipow__(self, other):
-        self.file.get_nested(*self.path[:-1])[self.path[-1]] **= other
+        self.file.resolve(*self.path[:-1])[self.path[-1]] **= other
+        self.file.invalidate(*self.path)
         return self()
 
     # Comparison methods (<, >, <=, >=, ==, !=)
     def __lt__(self, other):
-        return True if self() < other() else False
+        return True if self._get() < (other._get() if isinstance(other, Node) else other()) else False
 
     def __le__(self, other):
-        return True if self() <= other() else False
+        return True if self._get() <= (other._get() if isinstance(other, Node) else other()) else False
 
     def __gt__(self, other):
-        return True if self() > other() else False
+        return True if self._get() > (other._get() if isinstance(other, Node) else other()) else False
 
     def __ge__(self, other):
-        return True if self() >= other() else False
+        return True if self._get() >= (other._get() if isinstance(other, Node) else other()) else False
 
     def __eq__(self, other):
-        return True if self() == other() else False
+        return True if self._get() == (other._get() if isinstance(other, Node) else other()) else False
 
     def __ne__(self, other):
-        return True if self() != other() else False
+        return True if self._get() != (other._get() if isinstance(other, Node) else other()) else False
+
+
+
+def stream(filename: str, **file_args) -> Iterator[Tuple[str, Node]]:
+    """
+    Iterates over the top-level children of a file without loading the whole file into memory first.
+    Each child is wrapped in its own Node, so only one of them needs to be held in memory at a time.
+
+    :param filename: The file to read
+    :param file_args: filetype, password and salt, as they would be passed to the File class
+    :return: A generator of (name, Node) pairs
+    """
+    for key, value in iter_file(filename, **file_args):
+        yield key, Node(File({key: value}), path=[key])
+
+
+def attach(snapshot: Union[Snapshot, str]) -> Node:
+    """
+    Opens a snapshot created by Node.share. Values are unpickled from shared memory the first time they are accessed,
+    and any changes made to the returned Node stay local to this process.
 
+    :param snapshot: The Snapshot, or the name of its shared memory block
+    :return: A root Node containing the snapshot's data
+    """
+    if type(snapshot) is str:
+        snapshot = Snapshot(snapshot)
+    return Node(File(snapshot.data()))
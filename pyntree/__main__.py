@@ -0,0 +1,52 @@
+from argparse import ArgumentParser
+from getpass import getpass
+from pyntree.server import Server, AUTHKEY_VARIABLE
+import os
+
+PASSWORD_VARIABLE = 'PYNTREE_PASSWORD'
+
+
+def main(argv=None) -> None:
+    parser = ArgumentParser(prog='pyntree')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser(
+        'serve',
+        help='Load a file once and serve it to RemoteNode clients',
+        description=f'Clients must know the authentication key, which is read from {AUTHKEY_VARIABLE} '
+                    f'(or prompted for if it is unset).'
+    )
+    serve.add_argument('filename', help='The file to serve')
+    serve.add_argument('--socket', help='The path of the Unix socket to listen on')
+    serve.add_argument('--host', default='127.0.0.1', help='The host to listen on for TCP (if --port is set)')
+    serve.add_argument('--port', type=int, help='The port to listen on for TCP')
+    serve.add_argument('--filetype', help='The type of data stored in the file')
+    serve.add_argument('--password', action='store_true',
+                       help=f'The file is encrypted: read its password from {PASSWORD_VARIABLE}, or prompt for it')
+    serve.add_argument('--save-interval', type=float, default=1.0,
+                       help='The maximum number of seconds to wait before saving changes (default: 1)')
+    args = parser.parse_args(argv)
+
+    if (args.socket is None) == (args.port is None):
+        parser.error('serve requires exactly one of --socket or --port')
+    address = args.socket if args.socket else (args.host, args.port)
+    # Secrets are never taken as arguments, since those are visible to other users (e.g. in ps)
+    authkey = os.environ.get(AUTHKEY_VARIABLE) or getpass('Authentication key: ')
+    password = None
+    if args.password:
+        password = os.environ.get(PASSWORD_VARIABLE) or getpass('Password: ')
+    server = Server(
+        args.filename, address, save_interval=args.save_interval, authkey=authkey, filetype=args.filetype,
+        password=password
+    )
+    print(f'Serving {args.filename} on {server.address}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+from pyntree import encryption
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from hashlib import blake2b
+from typing import Any, Dict, Iterable, Tuple
+import pickle
+import sqlite3
+import time
+
+PROTOCOL = 4  # Fixed so that equal keys always pickle to the same bytes
+
+
+def connect(filename: str) -> sqlite3.Connection:
+    """
+    :param filename: The cache file to open (it will be created if it doesn't exist)
+    :return: A connection to the file, with the entries table created. It may be used from any thread (one at a time,
+    e.g. by a Server's handlers, which hold its lock).
+    """
+    connection = sqlite3.connect(filename, check_same_thread=False)
+    connection.execute("CREATE TABLE IF NOT EXISTS entries (key BLOB PRIMARY KEY, value BLOB NOT NULL)")
+    connection.commit()
+    return connection
+
+
+class CacheDict(MutableMapping):
+    """
+    A dictionary which keeps only some of its top-level values in memory. Each value is stored as its own row of an
+    SQLite file, loaded the first time it is accessed, and evicted again once it is the least recently used value and
+    the memory budget is exceeded (or it hasn't been used for longer than the TTL). Evicted values are written back
+    to the file (and committed, so other connections aren't locked out) if they have changed, and the values still
+    in memory are written when the File is saved.
+
+    Sizes are measured as the length of a value's pickled form. Don't keep references to values between accesses,
+    since changes made to a value after it has been evicted are lost.
+
+    Pickling a CacheDict (e.g. along with its Node, to send it to another process) only records how to reopen the
+    file, so the copy won't see changes which haven't been saved or written back yet.
+    """
+
+    def __init__(
+            self,
+            filename: str,
+            size: int = None,
+            ttl: float = None,
+            password: str = None,
+            salt: bytes = b'pyntree_default'
+    ) -> None:
+        """
+        :param filename: The cache file to use
+        :param size: The maximum number of bytes to keep in memory (None for no limit)
+        :param ttl: The number of seconds a value can go unused before it is evicted (None for no limit)
+        :param password: (Requires optional encryption depencies) Password to protect each value with
+        :param salt: Optional salt for the encryption process
+        """
+        self.filename = filename
+        self.size = size
+        self.ttl = ttl
+        self.password = password
+        self.salt = salt
+        self.connection = connect(filename)
+        self.keys_index = {
+            pickle.loads(key): None for key, in self.connection.execute("SELECT key FROM entries ORDER BY rowid")
+        }
+        self.resident = OrderedDict()  # key: (value, pickled size, digest, last used), least recently used first
+        self.deleted = set()  # Keys which have been deleted since the last flush
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Encoding
+    def encode(self, value) -> bytes:
+        data = pickle.dumps(value, PROTOCOL)
+        if self.password:
+            encryption.check()
+            data = encryption.encrypt(data, self.password, self.salt)
+        return data
+
+    @staticmethod
+    def digest(data: bytes) -> bytes:
+        return blake2b(data, digest_size=16).digest()
+
+    # Residency
+    def _load(self, key) -> Any:
+        if key in self.resident:
+            self.hits += 1
+            value, size, digest, _ = self.resident.pop(key)
+        else:
+            self.misses += 1
+            data = self.connection.execute(
+                "SELECT value FROM entries WHERE key = ?", (pickle.dumps(key, PROTOCOL),)
+            ).fetchone()[0]
+            if self.password:
+                encryption.check()
+                data = encryption.decrypt(data, self.password, self.salt)
+            value = pickle.loads(data)
+            size, digest = len(data), self.digest(data)
+            self.resident_bytes += size
+        self.resident[key] = (value, size, digest, time.monotonic())  # Move to the most recently used position
+        self.evict(keep=key)
+        return value
+
+    def _write_back(self, key, value, digest) -> Tuple[int, bytes]:
+        """
+        Writes a value to the file if it has changed since it was loaded, without committing
+        :return: The value's current pickled size and digest (which differs from the old one if it was written)
+        """
+        pickled = pickle.dumps(value, PROTOCOL)
+        current = self.digest(pickled)
+        if current != digest:
+            self.connection.execute(
+                "INSERT INTO entries (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (pickle.dumps(key, PROTOCOL), self.encode(value) if self.password else pickled)
+            )
+        return len(pickled), current
+
+    def evict(self, keep=None) -> None:
+        """
+        Evicts values until the memory budget is met, along with any values which have outlived the TTL.
+        :param keep: A key which must stay in memory (the one currently being used)
+        :return:
+        """
+        now = time.monotonic()
+        written = False
+        for key in list(self.resident):
+            if key == keep:
+                continue
+            expired = self.ttl is not None and now - self.resident[key][3] > self.ttl
+            over_budget = self.size is not None and self.resident_bytes > self.size
+            if not (expired or over_budget):
+                if self.ttl is None:
+                    break  # Values are in LRU order, so none of the remaining ones can be evicted either
+                continue
+            value, size, digest, _ = self.resident.pop(key)
+            written |= self._write_back(key, value, digest)[1] != digest
+            self.resident_bytes -= size
+            self.evictions += 1
+        if written:
+            self.connection.commit()
+
+    def flush(self) -> None:
+        """
+        Writes every deletion and changed value back to the file and commits it
+        :return:
+        """
+        self.connection.executemany(
+            "DELETE FROM entries WHERE key = ?", ((pickle.dumps(key, PROTOCOL),) for key in self.deleted)
+        )
+        self.deleted.clear()
+        for key, (value, size, digest, used) in list(self.resident.items()):
+            new_size, new_digest = self._write_back(key, value, digest)
+            self.resident[key] = (value, new_size, new_digest, used)
+            self.resident_bytes += new_size - size
+        self.connection.commit()
+        self.evict()
+
+    def replace(self, items: Iterable[Tuple[Any, Any]]) -> None:
+        """
+        Replaces the entire contents of the file, then commits it.
+        :param items: The (key, value) pairs to store
+        :return:
+        """
+        items = list(items)
+        self.connection.execute("DELETE FROM entries")
+        self.connection.executemany(
+            "INSERT INTO entries (key, value) VALUES (?, ?)",
+            ((pickle.dumps(key, PROTOCOL), self.encode(value)) for key, value in items)
+        )
+        self.connection.commit()
+        self.keys_index = {key: None for key, _ in items}
+        self.deleted.clear()
+        self.resident.clear()
+        self.resident_bytes = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: The cache's hit, miss and eviction counters, and how much of it is currently in memory
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'resident': len(self.resident),
+            'resident_bytes': self.resident_bytes
+        }
+
+    # Mapping interface
+    def __getitem__(self, key) -> Any:
+        if key not in self.keys_index:
+            raise KeyError(key)
+        return self._load(key)
+
+    def __setitem__(self, key, value) -> None:
+        if key in self.resident:
+            self.resident_bytes -= self.resident.pop(key)[1]
+        self.keys_index[key] = None
+        self.deleted.discard(key)
+        size = len(pickle.dumps(value, PROTOCOL))
+        self.resident[key] = (value, size, None, time.monotonic())  # No digest, so it will always be written
+        self.resident_bytes += size
+        self.evict(keep=key)
+
+    def __delitem__(self, key) -> None:
+        del self.keys_index[key]
+        if key in self.resident:
+            self.resident_bytes -= self.resident.pop(key)[1]
+        self.deleted.add(key)  # Removed from the file by the next flush, like any other change
+
+    def __contains__(self, key) -> bool:
+        return key in self.keys_index
+
+    def __iter__(self):
+        return iter(self.keys_index)
+
+    def __len__(self) -> int:
+        return len(self.keys_index)
+
+    def copy(self) -> dict:
+        return dict(self.items())
+
+    def __repr__(self) -> str:
+        return repr(self.copy())
+
+    def __reduce__(self):  # Reopen the file rather than copying the data, so the copy won't see unsaved changes
+        return CacheDict, (self.filename, self.size, self.ttl, self.password, self.salt)
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,109 @@
+from typing import Any, Dict, Sequence
+from array import array
+
+# Optional imports
+try:
+    import numpy
+    SUPPORTED = True
+except ImportError:
+    SUPPORTED = False
+
+AGGREGATIONS = ('sum', 'mean', 'count')
+
+
+def to_array(values: list) -> Sequence:
+    """
+    Packs a list of values into a typed array.
+    :param values: The values to pack
+    :return: A NumPy array if NumPy is installed, otherwise an array.array for numbers (or the list itself for
+    anything else, since array.array can only hold numbers)
+    """
+    if SUPPORTED:
+        if isinstance(values, array) or set(map(type, values)) <= {bool, int, float}:
+            return numpy.array(values)
+        # Anything else (strings, lists, mixed types...) is kept as is, one object per row, rather than being
+        # converted to a common type or spread over more dimensions
+        column = numpy.empty(len(values), dtype=object)
+        for i, value in enumerate(values):  # Assigned one by one, so that NumPy doesn't try to broadcast sequences
+            column[i] = value
+        return column
+    if isinstance(values, array):  # Already typed (e.g. a Table column), so just copy it
+        return array(values.typecode, values)
+    types = set(map(type, values))
+    if types <= {int}:
+        try:
+            return array('q', values)
+        except OverflowError:  # Too large for a 64-bit integer
+            return list(values)
+    if types <= {int, float}:
+        return array('d', values)
+    return list(values)
+
+
+def scalar(value) -> Any:
+    """
+    :return: The value as a Python object (NumPy returns its own scalar types, except for object arrays)
+    """
+    return value.item() if isinstance(value, numpy.generic) else value
+
+
+def total(column: Sequence) -> Any:
+    """
+    :param column: An array produced by to_array
+    :return: The sum of the column
+    """
+    if SUPPORTED and isinstance(column, numpy.ndarray):
+        return scalar(column.sum()) if column.size else 0
+    return sum(column)
+
+
+def mean(column: Sequence) -> float:
+    """
+    :param column: An array produced by to_array
+    :return: The arithmetic mean of the column
+    """
+    if not len(column):
+        raise ValueError("Cannot take the mean of an empty column.")
+    if SUPPORTED and isinstance(column, numpy.ndarray):
+        return scalar(column.mean())
+    return sum(column) / len(column)
+
+
+def group(keys: Sequence, column: Sequence, agg: str) -> Dict[Any, Any]:
+    """
+    Aggregates a column for each distinct key.
+    :param keys: An array of keys, one per row
+    :param column: An array of values, one per row (ignored for 'count')
+    :param agg: 'sum', 'mean' or 'count'
+    :return: A dictionary of each key and its aggregated value, in order of first appearance
+    """
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation '{agg}', expected one of {', '.join(AGGREGATIONS)}.")
+    # numpy.unique sorts the keys, so keys which can't be ordered (e.g. strings mixed with None) use the dictionary
+    if SUPPORTED and isinstance(keys, numpy.ndarray) and len(keys) and keys.dtype.kind != 'O':
+        unique, first, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+        counts = numpy.bincount(inverse)
+        if agg == 'count':
+            results = counts
+        else:
+            results = numpy.zeros(len(unique), dtype=numpy.result_type(column.dtype, numpy.int64))
+            numpy.add.at(results, inverse, column)  # Unlike bincount, this keeps integer sums exact
+            if agg == 'mean':
+                results = results / counts
+        order = numpy.argsort(first)
+        return dict(zip(unique[order].tolist(), results[order].tolist()))
+
+    if SUPPORTED:  # Iterate over Python objects rather than NumPy scalars
+        keys = keys.tolist() if isinstance(keys, numpy.ndarray) else keys
+        column = column.tolist() if isinstance(column, numpy.ndarray) else column
+    sums = {}
+    counts = {}
+    for i, key in enumerate(keys):
+        counts[key] = counts.get(key, 0) + 1
+        if agg != 'count':
+            sums[key] = sums.get(key, 0) + column[i]
+    if agg == 'count':
+        return counts
+    if agg == 'sum':
+        return sums
+    return {key: sums[key] / counts[key] for key in sums}
@@ -0,0 +1,95 @@
+from pyntree.table import Table
+from collections.abc import Mapping
+from datetime import date, time, timedelta
+from hashlib import blake2b
+from typing import List, Tuple
+import pickle
+import zlib
+
+PROTOCOL = 4  # Fixed so that equal values always hash the same
+SET = 0
+DELETE = 1
+
+
+class HashNode:
+    """
+    Caches the hash of a subtree (and its address in the File's version store), and the caches of its children.
+    Node methods which change data clear the caches along the path of the change, so unchanged subtrees never have to
+    be hashed (or stored) again.
+    """
+    __slots__ = ('digest', 'address', 'children')
+
+    def __init__(self) -> None:
+        self.digest = None
+        self.address = None
+        self.children = {}
+
+    def child(self, name) -> 'HashNode':
+        if name not in self.children:
+            self.children[name] = HashNode()
+        return self.children[name]
+
+
+IMMUTABLE = (type(None), bool, int, float, complex, str, bytes, date, time, timedelta)
+
+
+def is_mutable(value) -> bool:
+    """
+    :return: Whether the value could be changed in place (which would make its cached hashes wrong)
+    """
+    return not isinstance(value, IMMUTABLE)
+
+
+def is_tree(value) -> bool:
+    return isinstance(value, Mapping) and not isinstance(value, Table)  # Tables are compared as a whole
+
+
+def digest(value, cache: HashNode) -> bytes:
+    """
+    :param value: The value to hash
+    :param cache: The value's hash cache, which is filled in as a side effect
+    :return: A hash of the value which doesn't depend on the order of dictionary keys
+    """
+    if cache.digest is None:
+        if is_tree(value):
+            parts = sorted(
+                (pickle.dumps(key, PROTOCOL), digest(child, cache.child(key))) for key, child in value.items()
+            )
+            data = b''.join(key + child for key, child in parts)
+            cache.digest = blake2b(data, digest_size=16, person=b'tree').digest()
+        else:
+            cache.digest = blake2b(pickle.dumps(value, PROTOCOL), digest_size=16).digest()
+    return cache.digest
+
+
+def diff(old, new, old_cache: HashNode, new_cache: HashNode, path: tuple = ()) -> List[Tuple]:
+    """
+    :return: The changes needed to turn old into new, as (SET, path, value) and (DELETE, path) tuples
+    """
+    if digest(old, old_cache) == digest(new, new_cache):
+        return []
+    if not (is_tree(old) and is_tree(new)):
+        return [(SET, path, new)]
+    changes = [(DELETE, path + (key,)) for key in old if key not in new]
+    for key, value in new.items():
+        if key in old:
+            changes += diff(old[key], value, old_cache.child(key), new_cache.child(key), path + (key,))
+        else:
+            changes.append((SET, path + (key,), value))
+    return changes
+
+
+def dumps(patch: List[Tuple]) -> bytes:
+    """
+    :return: A compact, compressed form of a patch, for sending to replicas
+    """
+    return zlib.compress(pickle.dumps(patch, pickle.HIGHEST_PROTOCOL))
+
+
+def loads(data: bytes) -> List[Tuple]:
+    """
+    Patches are pickled, and unpickling can run arbitrary code, so only load patches which come from a trusted peer
+    (or arrive over an authenticated connection).
+    :return: The patch stored in the output of dumps
+    """
+    return pickle.loads(zlib.decompress(data))
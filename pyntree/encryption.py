@@ -6,8 +6,10 @@ try:
 except:
     SUPPORTED = False
     from pyntree.errors import Error
+from functools import lru_cache
 
 
+@lru_cache(maxsize=16)  # Deriving a key is deliberately slow, and files encrypt many values with the same one
 def derive_key(password: str, salt: bytes):
     password = password.encode()
     key = hash_secret_raw(
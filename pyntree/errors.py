@@ -7,3 +7,15 @@ class Error:
 
     class EncryptionNotAvailable(Exception):
         pass
+
+    class SharedMemoryNotAvailable(Exception):
+        pass
+
+    class SchemaMismatch(Exception):
+        pass
+
+    class AuthenticationFailed(Exception):
+        pass
+
+    class FileChanged(Exception):
+        pass
@@ -1,13 +1,23 @@
 from os.path import exists
+import mmap
+import os
 from pyntree.errors import Error
+from pyntree.incremental import scan_json, iter_json, iter_yaml, LazyDict
+from pyntree.table import Table, json_default, json_loads, register_yaml  # Table is needed to eval txt files
+from pyntree.cache import CacheDict, connect
+from pyntree.handles import POOL
+from pyntree.versions import VersionStore
+from pyntree.diff import HashNode, is_mutable
 import compress_pickle as pickle
 import json
 import yaml
+from typing import Any, Dict, List
 
 try:
     from yaml import CLoader as Loader, CDumper as Dumper
 except ImportError:
     from yaml import Loader, Dumper
+register_yaml(Loader, Dumper, yaml.Loader)  # yaml.Loader is used for streaming
 
 # Optional imports
 from pyntree import encryption
@@ -19,6 +29,7 @@ EXTENSIONS = {
     "json": "json",
     "yaml": "yaml",
     "yml": "yaml",
+    "pyncache": "cache",
     **pickle.get_registered_extensions()
 }
 DEFAULT_FILETYPE = 'pyn'
@@ -33,6 +44,36 @@ def infer_filetype(data) -> str:
     return DEFAULT_FILETYPE
 
 
+def stamp(file) -> tuple:
+    """
+    :return: The size and modification time of an open file, which change whenever it is written to
+    """
+    status = os.fstat(file.fileno())
+    return status.st_size, status.st_mtime_ns
+
+
+def iter_file(filename, filetype=None, password=None, salt=b'pyntree_default'):
+    """
+    Reads the top-level items of a file one at a time instead of deserializing the whole file.
+    JSON values are located by scanning the raw bytes and YAML is read event by event. Other filetypes and encrypted
+    files can't be read in pieces, so they are loaded in full and then iterated over.
+    :param filename: The name of the file to read
+    :param filetype: The type of data stored in the file
+    :param password: The password the file is encrypted with, if any
+    :param salt: The salt the file is encrypted with, if any
+    :return: A generator of (key, value) pairs
+    """
+    filetype = infer_filetype(filename) if filetype is None else filetype
+    if password or filetype not in ('json', 'yaml'):
+        yield from File(filename, filetype=filetype, password=password, salt=salt).data.items()
+        return
+    with open(filename, 'rb') as file:
+        if filetype == 'json':
+            yield from iter_json(file)
+        else:
+            yield from iter_yaml(file)
+
+
 class File:
     def __init__(
             self,
@@ -41,12 +82,16 @@ class File:
             autosave=False,
             save_on_close=False,
             password=None,
-            salt=b'pyntree_default'  # Default salt value for those who just want to use a password
+            salt=b'pyntree_default',  # Default salt value for those who just want to use a password
+            lazy=False,
+            cache_size=64 * 1024 ** 2,
+            cache_ttl=None
     ) -> None:
 
         """
         Load a file for use with a Node object. If the filetype is unknown, 'pyn' will be used.
         Use switch_to_file to change the filename, as changing File.name will not update the file object.
+        File objects are opened through a shared pool (pyntree.handles.POOL) which limits how many are open at once.
 
         Filetype options:
 
@@ -54,6 +99,8 @@ class File:
         - bz2, gzip, lz4, lzma, None, pickle, zipfile (Compressed data of their respective types)
         - txt (plain text data)
         - json
+        - yaml
+        - cache (Stores each top-level value separately, and only keeps recently used ones in memory)
 
         :param data: The filename or dictionary object
         :param filetype: The type of data stored/to store
@@ -61,12 +108,20 @@ class File:
         :param save_on_close: Whether to save the file when this object is destroyed (irrelevant if autosave = True)
         :param password: (Requires optional encryption depencies) Password to protect the file with
         :param salt: Optional salt for the encryption process
+        :param lazy: (Unencrypted JSON only) Index the top-level keys when opening, and only parse a value when it is
+        first accessed. Other filetypes are loaded normally.
+        :param cache_size: (cache filetype only) The number of bytes of data to keep in memory, or None for no limit
+        :param cache_ttl: (cache filetype only) Evict values which haven't been used for this many seconds
         """
         self.password = password
         self.salt = salt
+        self.lazy = lazy
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
         self.autosave = autosave
         self.save_on_close = save_on_close
-        self.file = None
+        self.path = None  # The key of the file object in the handle pool
+        self.hashes = HashNode()  # Cached subtree hashes, used by Node.diff
         if type(data) is str:  # Helps a Data class work
             self.switch_to_file(data, filetype=filetype)
             self.data = self.read_data()  # Not to be confused with the data parameter
@@ -80,8 +135,14 @@ class File:
         """
         :return: The data currently stored in the file
         """
-        self.file.seek(0)
-        data = self.file.read()
+        if self.lazy and self.filetype == 'json' and not self.password:
+            return self.read_index()
+        elif self.filetype == 'cache':
+            return CacheDict(self.name, self.cache_size, self.cache_ttl, self.password, self.salt)
+
+        with POOL.lease(self.path) as file:
+            file.seek(0)
+            data = file.read()
 
         if self.password:
             encryption.check()
@@ -90,7 +151,7 @@ class File:
         if self.filetype == 'pyn':
             return pickle.loads(data, None)
         elif self.filetype == 'json':
-            return json.loads(data.decode())
+            return json_loads(data.decode())
         elif self.filetype == 'yaml':
             return yaml.load(data, Loader=Loader)
         elif self.filetype == 'txt':
@@ -98,22 +159,93 @@ class File:
         elif self.filetype in pickle.get_known_compressions():
             return pickle.loads(data, self.filetype)
 
+    def read_index(self) -> dict:
+        """
+        Scans the top level of a JSON file and records where each value is, without parsing any of them.
+        :return: A LazyDict which parses values from the file as they are accessed
+        """
+        try:
+            with POOL.lease(self.path) as file:  # The map keeps its own descriptor, so it outlives the lease
+                self.indexed = stamp(file)
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty files cannot be mapped
+            return {}
+        try:
+            index = list(scan_json(buffer))
+        finally:
+            buffer.close()
+        POOL.add_reader(self.path, self)  # Other Files saving to this path will make it load the rest first
+        return LazyDict(self.read_range, index, decode=json_loads)
+
+    def read_range(self, start, end) -> bytes:
+        """
+        :param start: The offset to start reading from
+        :param end: The offset to stop reading at
+        :return: The bytes stored between the two offsets of the file
+        """
+        with POOL.lease(self.path) as file:
+            if stamp(file) != self.indexed:
+                raise Error.FileChanged(
+                    f"{self.name} has been changed by another program since it was indexed, so its remaining values "
+                    f"can't be read. Use reload to read it again."
+                )
+            file.seek(start)
+            return file.read(end - start)
+
+    def load_all(self) -> None:
+        """
+        Parses any values which have not been loaded yet (see the lazy parameter), so that the data no longer depends
+        on the contents of the file.
+        :return:
+        """
+        if type(self._data) is LazyDict:
+            self._data = self._data.copy()  # The same data, so the cached hashes are still valid
+
+    @property
+    def data(self) -> Any:
+        """
+        :return: The data stored in the file. Since it may be changed in place, getting (or replacing) it clears every
+        cached hash (see invalidate). Use resolve to read it without doing so.
+        """
+        self.invalidate()
+        return self._data
+
+    @data.setter
+    def data(self, value) -> None:
+        if value is not self.__dict__.get('_data'):
+            self.close_cache()  # Replaced, so its connection would otherwise stay open
+        self._data = value
+        self.hashes = HashNode()
+
+    @property
+    def file(self):
+        """
+        :return: The open file object, or None if there is no filename. It may be closed when other files are
+        opened, so get it again rather than keeping it, and use pyntree.handles.POOL.lease(self.path) instead when
+        other threads may be using files.
+        """
+        return POOL.get(self.path) if self.path else None
+
     # noinspection PyAttributeOutsideInit
     def switch_to_file(self, filename, filetype=None) -> None:
         """
-        Closes the old file object (if it exists) and replaces it with a new one.
+        Releases the old file object (if it exists) and replaces it with a new one.
         :param filename: The name of the file to switch to
         :param filetype: The type of data stored in the file to switch to
         :return:
         """
         self.name = filename
-        if self.file:  # Close open file if it exists
-            self.file.close()
+        if self.path:  # Release open file if it exists
+            self.load_all()
+            POOL.release(self.path)
+            self.path = None
         if filetype is None:
             self.filetype = infer_filetype(filename)
         else:
             self.filetype = filetype
-        if not exists(filename):
+        if not exists(filename) and self.filetype == 'cache':
+            connect(filename).close()
+        elif not exists(filename):
             with open(filename, 'wb') as file:  # Create file in proper format if it doesn't exist
                 if self.filetype in ('json', 'txt', 'yaml'):
                     to_write = b'{}'
@@ -125,7 +257,7 @@ class File:
                     encryption.check()
                     to_write = encryption.encrypt(to_write, self.password, self.salt)
                 file.write(to_write)
-        self.file = open(filename, 'rb+')
+        self.path = POOL.open(filename)
 
     def reload(self):
         """
@@ -134,58 +266,233 @@ class File:
         """
         self.data = self.read_data()
 
-    # noinspection PyUnboundLocalVariable
     def save(self, filename=None, password=None) -> None:
         """
         Saves the data to the file
-        :param filename: If set, the Node will save to the specified file and then reload its original file object
+        :param filename: If set, the data is written to the specified file instead, and the File keeps using its
+        original file object. If the File has no filename yet, it switches to this one.
         :param password: Set or override the encryption password. This will also change the password parameter.
         """
-        if filename:  # Only keeps 1 file in memory at a time
-            old_filename = self.name
+        if filename and not self.name:
             self.switch_to_file(filename)
-        elif not self.file and not filename:
+        elif not self.name:
             raise Error.FileNameUnset(
                 "You have not specified a filename for this data. "
                 "Try setting the filename parameter or use switch_to_file."
             )
-        
-        if self.filetype == 'pyn':
-            to_write = pickle.dumps(self.data, None)
-        elif self.filetype == 'json':
-            to_write = json.dumps(self.data, sort_keys=True, indent=2).encode()
-        elif self.filetype == 'yaml':
-            to_write = yaml.dump(self.data, sort_keys=True, indent=2, Dumper=Dumper).encode()
-        elif self.filetype == 'txt':
-            to_write = str(self.data).encode()
-        elif self.filetype in pickle.get_known_compressions():
-            to_write = pickle.dumps(self.data, self.filetype)
-
+        if filename == self.name:
+            filename = None
         if password:
             self.password = password
+        filetype = infer_filetype(filename) if filename else self.filetype
+
+        if filetype == 'cache':
+            self.save_cache(filename or self.name)
+            return
+        if not filename:
+            self.load_all()  # The file is about to be overwritten
+        to_write = self.serialize(filetype)
+
+        if filename:  # Written separately, so the original file object is left alone
+            with POOL.locked(filename):
+                POOL.preserve(filename)
+                with open(filename, 'wb') as file:
+                    file.write(to_write)
+                POOL.reset(filename)
+        else:
+            with POOL.lease(self.path) as file:
+                POOL.preserve(self.path)
+                file.seek(0)
+                file.write(to_write)
+                file.truncate()
+                file.flush()
+
+    # noinspection PyUnboundLocalVariable
+    def serialize(self, filetype) -> bytes:
+        """
+        :param filetype: The type of data to produce
+        :return: The data, as it would be written to a file of that type (encrypted if there is a password)
+        """
+        # Cached and lazily loaded data is only partially in memory, so it has to be read in full to be written as a
+        # single file (and as a plain dictionary, since YAML would otherwise record the class)
+        data = self._data.copy() if type(self._data) in (CacheDict, LazyDict) else self._data
+
+        if filetype == 'pyn':
+            to_write = pickle.dumps(data, None)
+        elif filetype == 'json':
+            to_write = json.dumps(data, sort_keys=True, indent=2, default=json_default).encode()
+        elif filetype == 'yaml':
+            to_write = yaml.dump(data, sort_keys=True, indent=2, Dumper=Dumper).encode()
+        elif filetype == 'txt':
+            to_write = str(data).encode()
+        elif filetype in pickle.get_known_compressions():
+            to_write = pickle.dumps(data, filetype)
+
         if self.password:
             encryption.check()
             to_write = encryption.encrypt(to_write, self.password, self.salt)
-        
-        self.file.seek(0)
-        self.file.write(to_write)
-        self.file.truncate()
-        if filename and old_filename:  # If the old filename was None, then it can't be switched back to
-            self.switch_to_file(old_filename)
+        return to_write
 
-    def get_nested(self, *args):
-        found = self.data
-        for child in args:
+    def save_cache(self, filename) -> None:
+        """
+        Saves the data to a cache file. Only values which have changed are written if the data came from that file.
+        :param filename: The cache file to save to
+        :return:
+        """
+        data = self._data
+        if type(data) is CacheDict and data.filename == filename and data.password == self.password:
+            data.flush()
+        else:
+            cache = CacheDict(filename, password=self.password, salt=self.salt)
+            cache.replace(data.items())
+            cache.close()
+            if type(data) is CacheDict and data.filename == filename:  # The password has changed
+                self.data = self.read_data()
+
+    @property
+    def cache_stats(self) -> Dict[str, int]:
+        """
+        :return: (cache filetype only) The cache's hit, miss and eviction counters, and how much of the data is
+        currently in memory, or None for other filetypes
+        """
+        return self._data.stats if type(self._data) is CacheDict else None
+
+    def close_cache(self) -> None:
+        """
+        Closes the connection to this file's cache, if the data came from it. Unsaved changes are discarded.
+        :return:
+        """
+        data = self.__dict__.get('_data')
+        if type(data) is CacheDict and data.filename == self.name:  # Not data borrowed from another File
+            data.close()
+
+    # Versioning
+    def version_store(self) -> VersionStore:
+        """
+        :return: The store holding this file's snapshots, which is kept next to the file as <filename>.versions
+        """
+        if not self.name:
+            raise Error.FileNameUnset(
+                "Snapshots are stored next to the file, but you have not specified a filename for this data. "
+                "Try using switch_to_file first."
+            )
+        return VersionStore(f'{self.name}.versions', self.password, self.salt)
+
+    def snapshot(self) -> int:
+        """
+        Stores the current data as a new version. Dictionaries which are identical to ones in earlier versions are
+        not stored again, and dictionaries which haven't been changed or handed out (by a Node, get_nested or the data
+        property, since they could then be changed in place) since the last snapshot aren't even read, so each
+        snapshot only costs about as much as what has changed.
+        :return: The number of the new version
+        """
+        store = self.version_store()
+        try:
+            return store.snapshot(self._data, self.hashes)
+        finally:
+            store.close()
+
+    def versions(self) -> List[Dict[str, Any]]:
+        """
+        :return: A list of every version, with its number, time, root hash and the number of objects it added
+        """
+        store = self.version_store()
+        try:
+            return store.versions()
+        finally:
+            store.close()
+
+    def restore(self, version: int, *path) -> Any:
+        """
+        Replaces the data (or part of it) with its contents from an earlier version.
+        :param version: The number of the version to restore
+        :param path: The names leading to the part of the data to restore (all of it if empty). Only this part of the
+        version is read.
+        :return: The restored data
+        """
+        store = self.version_store()
+        try:
+            restored = store.load(version, *path)
+        finally:
+            store.close()
+        if path:
+            self.resolve(*path[:-1])[path[-1]] = restored
+        else:
+            self.data = restored
+        self.invalidate(*path)
+        if self.autosave:
+            self.save()
+        return restored
+
+    def hash_node(self, *path) -> HashNode:
+        """
+        :param path: The names leading to a subtree
+        :return: The cache of the subtree's hashes (created if needed)
+        """
+        cache = self.hashes
+        for name in path:
+            cache = cache.child(name)
+        return cache
+
+    def invalidate(self, *path) -> None:
+        """
+        Clears the cached hashes of the subtree at the path and of everything containing it. This happens
+        automatically whenever a mutable value is handed out (by a Node, get_nested or the data property), so it is
+        only needed after changing a value obtained through resolve.
+        :param path: The names leading to the changed data (everything if empty)
+        :return:
+        """
+        if not path:
+            self.hashes = HashNode()
+            return
+        cache = self.hashes
+        for name in path[:-1]:
+            cache.digest = cache.address = None
+            cache = cache.children.get(name)
+            if cache is None:
+                return
+        cache.digest = cache.address = None
+        cache.children.pop(path[-1], None)
+
+    def resolve(self, *path) -> Any:
+        """
+        Like get_nested, but the cached hashes are kept, so the returned value must not be changed in place (unless
+        invalidate is called afterwards).
+        :param path: The names leading to the value
+        :return: The value
+        """
+        found = self._data
+        for child in path:
             found = found[child]  # Move 1 deeper towards the target
         return found
 
+    def get_nested(self, *args):
+        found = self.resolve(*args)
+        if is_mutable(found):  # It may be changed in place, so its cached hashes can't be trusted anymore
+            self.invalidate(*args)
+        return found
+
     def __del__(self) -> None:
         """
-        Garbage collector function for implementing save_on_close and properly closing the file object
+        Garbage collector function for implementing save_on_close and properly releasing the file object
         :return:
         """
-        if 'file' in self.__dict__.keys():  # If file attribute was set
+        if 'path' in self.__dict__.keys():  # If path attribute was set
             if self.save_on_close:
                 self.save()
-            if self.file:
-                self.file.close()
+            self.close_cache()
+            if self.path:
+                POOL.release(self.path)
+
+    def __getstate__(self):  # When pickled
+        state = self.__dict__.copy()
+        state['path'] = None  # The unpickled File isn't registered with the pool until it calls switch_to_file
+        return state
+
+    def __setstate__(self, state):  # When unpickled
+        state.pop('file', None)  # Files pickled by older versions hold their own (closed) file object
+        if 'data' in state:  # Stored before data became a property
+            state['_data'] = state.pop('data')
+        self.__dict__.update(path=None, lazy=False, cache_size=64 * 1024 ** 2, cache_ttl=None)  # Also missing there
+        self.__dict__.update(state)
+        self.hashes = HashNode()
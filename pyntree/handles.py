@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from os.path import abspath
+from threading import RLock
+from typing import BinaryIO, Dict, Iterator
+from weakref import WeakSet
+
+
+class HandlePool:
+    """
+    Shares open file objects between File objects, and limits how many are open at once. When the limit is reached,
+    the least recently used handle is closed, and it is reopened the next time it is needed.
+    Files using the same path share a single handle (and file position), so every seek/read/write sequence must be
+    made inside lease, which locks the path and keeps its handle from being closed until the sequence is done.
+    """
+
+    def __init__(self, limit: int = 128) -> None:
+        """
+        :param limit: The maximum number of file objects to keep open (exceeded only while every handle is leased)
+        """
+        self.limit = limit
+        self.handles = OrderedDict()  # path: file object, least recently used first
+        self.users = {}  # path: the number of File objects using it
+        self.pinned = {}  # path: the number of leases currently using its handle
+        self.path_locks = {}  # path: the lock held by leases, for every path with users
+        self.readers = {}  # path: the Files which still read values from it lazily
+        self.opens = 0
+        self.lock = RLock()  # Always acquired after a path lock, never before
+
+    def open(self, filename: str) -> str:
+        """
+        Registers a new user of a file. The file must already exist.
+        :param filename: The name of the file
+        :return: The key to pass to lease and release (the absolute path, so that changing directory is harmless)
+        """
+        path = abspath(filename)
+        with self.lock:
+            self.users[path] = self.users.get(path, 0) + 1
+            self.path_locks.setdefault(path, RLock())
+            self.get(path)
+        return path
+
+    def get(self, path: str) -> BinaryIO:
+        """
+        Only use the returned file object directly when no other thread uses the pool, since it may be closed (or its
+        position moved) at any time otherwise. Use lease instead.
+        :param path: A key returned by open
+        :return: An open file object for the path, opened for reading and writing
+        """
+        with self.lock:
+            handle = self.handles.get(path)
+            if handle is None or handle.closed:
+                handle = self.handles[path] = open(path, 'rb+')
+                self.opens += 1
+            self.handles.move_to_end(path)
+            self.evict()
+            return handle
+
+    def evict(self) -> None:
+        """
+        Closes the least recently used handles which aren't leased until the limit is met. The lock must be held.
+        """
+        excess = len(self.handles) - self.limit
+        for path in list(self.handles):
+            if excess <= 0:
+                break
+            if path not in self.pinned:
+                self.handles.pop(path).close()
+                excess -= 1
+
+    @contextmanager
+    def locked(self, filename: str) -> Iterator[None]:
+        """
+        Holds the lock of a file's path (if it is in use) for the duration of a with block, so that no lease of it
+        can run at the same time.
+        :param filename: The name of the file
+        """
+        path = abspath(filename)
+        with self.lock:
+            lock = self.path_locks.get(path)
+        if lock is None:
+            yield
+        else:
+            with lock:
+                yield
+
+    @contextmanager
+    def lease(self, path: str) -> Iterator[BinaryIO]:
+        """
+        Provides the file object for a path for the duration of a with block. The handle won't be closed and no other
+        lease of the same path can run until the block ends, so it is safe to seek, read and write inside it.
+        :param path: A key returned by open
+        """
+        with self.locked(path):
+            with self.lock:
+                self.pinned[path] = self.pinned.get(path, 0) + 1
+                handle = self.get(path)
+            try:
+                yield handle
+            finally:
+                with self.lock:
+                    self.pinned[path] -= 1
+                    if not self.pinned[path]:
+                        del self.pinned[path]
+                        if path not in self.users:  # Released while leased
+                            handle = self.handles.pop(path, None)
+                            if handle:
+                                handle.close()
+                    self.evict()
+
+    def add_reader(self, path: str, reader) -> None:
+        """
+        Registers an object which reads parts of a file on demand, so that preserve can make it read the rest before
+        the file is overwritten.
+        :param path: A key returned by open
+        :param reader: An object with a load_all method (it is only referenced weakly)
+        :return:
+        """
+        with self.lock:
+            self.readers.setdefault(path, WeakSet()).add(reader)
+
+    def preserve(self, filename: str) -> None:
+        """
+        Makes every reader of a file load the rest of its data. Call this (holding locked(filename)) before
+        overwriting the file.
+        :param filename: The name of the file
+        :return:
+        """
+        with self.lock:
+            readers = list(self.readers.pop(abspath(filename), ()))
+        for reader in readers:
+            reader.load_all()
+
+    def reset(self, filename: str) -> None:
+        """
+        Closes the pooled handle for a file (if there is one) so that it is reopened on its next use.
+        Call this after writing to the file through another file object, since the pooled one may have buffered
+        the old contents. Hold locked(filename) around the write and the reset so that no lease reads in between.
+        :param filename: The name of the file
+        :return:
+        """
+        with self.locked(filename), self.lock:
+            handle = self.handles.pop(abspath(filename), None)
+            if handle:
+                handle.close()
+
+    def release(self, path: str) -> None:
+        """
+        Unregisters a user of a file, and closes the file if it was the last one (once it is no longer leased).
+        :param path: A key returned by open
+        :return:
+        """
+        with self.lock:
+            self.users[path] -= 1
+            if self.users[path] <= 0:
+                del self.users[path]
+                del self.path_locks[path]
+                self.readers.pop(path, None)
+                if path not in self.pinned:
+                    handle = self.handles.pop(path, None)
+                    if handle:
+                        handle.close()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: The number of open handles, the number of paths in use, and how many times a file has been opened
+        """
+        return {'open': len(self.handles), 'paths': len(self.users), 'opens': self.opens}
+
+
+POOL = HandlePool()  # Shared by every File
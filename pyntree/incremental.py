@@ -0,0 +1,202 @@
+from typing import Any, Callable, Iterator, Tuple
+import json
+import mmap
+import re
+import yaml
+from pyntree.table import json_loads
+
+# Strings are matched whole so that brackets and commas inside them are never mistaken for structure
+JSON_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\],:]')
+JSON_WHITESPACE = b' \t\n\r'
+
+
+def scan_json(buffer) -> Iterator[Tuple[str, int, int]]:
+    """
+    Walks the top level of a JSON object without building any of its values.
+    Only strings and structural characters are inspected, so nested data is skipped over rather than parsed.
+    :param buffer: A bytes-like object (bytes, mmap, etc.) containing a JSON object
+    :return: A generator of (key, start, end) tuples, where buffer[start:end] is the JSON of the key's value
+    """
+    pos = 0
+    while pos < len(buffer) and buffer[pos:pos + 1] in JSON_WHITESPACE:
+        pos += 1
+    if buffer[pos:pos + 1] != b'{':
+        raise ValueError("The top level of the JSON data is not an object.")
+
+    depth = 0
+    key = None
+    start = None
+    expecting_key = False
+    for match in JSON_TOKEN.finditer(buffer, pos):
+        token = match.group()
+        if token in (b'{', b'['):
+            depth += 1
+            expecting_key = depth == 1
+        elif token in (b'}', b']'):
+            if depth == 1 and key is not None:
+                yield key, start, match.start()
+                key = None
+            depth -= 1
+            if depth == 0:
+                return
+        elif depth != 1:
+            continue
+        elif token == b',':
+            yield key, start, match.start()
+            key = None
+            expecting_key = True
+        elif token == b':':
+            start = match.end()
+        elif expecting_key:  # A string at the top level is either a key or a value
+            key = json.loads(token)
+            expecting_key = False
+    raise ValueError("The JSON data ended before the top-level object was closed.")
+
+
+def iter_json(file) -> Iterator[Tuple[str, Any]]:
+    """
+    :param file: A binary file object opened for reading
+    :return: A generator of the top-level (key, value) pairs, decoding one value at a time
+    """
+    try:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:  # Empty files cannot be mapped
+        return
+    try:
+        for key, start, end in scan_json(buffer):
+            yield key, json_loads(buffer[start:end])
+    finally:
+        buffer.close()
+
+
+def iter_yaml(file) -> Iterator[Tuple[Any, Any]]:
+    """
+    Drives the pure-python YAML loader one event at a time, so only one top-level value is ever composed at once.
+    The C loader does not expose its composer, which is why it is not used here.
+    :param file: A file object opened for reading
+    :return: A generator of the top-level (key, value) pairs
+    """
+    loader = yaml.Loader(file)
+    try:
+        loader.get_event()  # StreamStart
+        if loader.check_event(yaml.StreamEndEvent):  # Empty file
+            return
+        loader.get_event()  # DocumentStart
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise ValueError("The top level of the YAML data is not a mapping.")
+        loader.get_event()  # MappingStart
+        while not loader.check_event(yaml.MappingEndEvent):
+            key_node = loader.compose_node(None, None)
+            value_node = loader.compose_node(None, None)
+            yield loader.construct_object(key_node, deep=True), loader.construct_object(value_node, deep=True)
+            # Anchors are kept (they may be referenced later), but constructed values are not needed again
+            loader.constructed_objects = {}
+            loader.recursive_objects = {}
+    finally:
+        loader.dispose()
+
+
+class Unloaded:
+    """
+    Placeholder for a value in a LazyDict which has not been parsed yet.
+    """
+    __slots__ = ('start', 'end')
+
+    def __init__(self, start: int, end: int) -> None:
+        self.start = start
+        self.end = end
+
+
+class LazyDict(dict):
+    """
+    A dictionary whose values are parsed from their byte range of the source the first time they are accessed.
+    Any operation which needs every value (comparison, copying, pickling, etc.) loads the remaining values first.
+    """
+
+    def __init__(self, read: Callable[[int, int], bytes], index, decode: Callable[[bytes], Any] = json_loads) -> None:
+        """
+        :param read: A function which returns the bytes between two offsets of the source
+        :param index: An iterable of (key, start, end) tuples, as produced by scan_json
+        :param decode: The function used to turn the bytes of a value into the value itself
+        """
+        super().__init__((key, Unloaded(start, end)) for key, start, end in index)
+        self.read = read
+        self.decode = decode
+
+    def _load(self, key, value) -> Any:
+        if type(value) is Unloaded:
+            value = self.decode(self.read(value.start, value.end))
+            dict.__setitem__(self, key, value)
+        return value
+
+    def load_all(self) -> None:
+        """
+        Parses every value which has not been loaded yet
+        :return:
+        """
+        for key, value in dict.items(self):
+            if type(value) is Unloaded:
+                self._load(key, value)
+
+    @property
+    def loaded(self) -> bool:
+        """
+        :return: Whether every value has been parsed
+        """
+        return not any(type(value) is Unloaded for value in dict.values(self))
+
+    def __getitem__(self, key) -> Any:
+        return self._load(key, dict.__getitem__(self, key))
+
+    def get(self, key, default=None) -> Any:
+        if key in self:
+            return self[key]
+        return default
+
+    def pop(self, key, *default) -> Any:
+        value = dict.pop(self, key, *default)
+        if type(value) is Unloaded:
+            value = self.decode(self.read(value.start, value.end))
+        return value
+
+    def popitem(self) -> Tuple[Any, Any]:
+        key, value = dict.popitem(self)
+        if type(value) is Unloaded:
+            value = self.decode(self.read(value.start, value.end))
+        return key, value
+
+    def setdefault(self, key, default=None) -> Any:
+        if key in self:
+            return self[key]
+        dict.__setitem__(self, key, default)
+        return default
+
+    def __iter__(self):  # Overriding this also stops dict() and {**x} from copying the placeholders directly
+        return iter(self.keys())
+
+    def values(self):
+        self.load_all()
+        return dict.values(self)
+
+    def items(self):
+        self.load_all()
+        return dict.items(self)
+
+    def copy(self) -> dict:
+        return dict(self.items())
+
+    def __eq__(self, other) -> bool:
+        self.load_all()
+        if type(other) is LazyDict:  # dict.__eq__ would compare against its placeholders
+            other.load_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other) -> bool:
+        return not self == other
+
+    def __repr__(self) -> str:
+        self.load_all()
+        return dict.__repr__(self)
+
+    def __reduce__(self):  # Pickle as a plain dictionary
+        return dict, (self.copy(),)
@@ -0,0 +1,540 @@
+"""
+Serves a single File to many clients over a Unix or TCP socket, so that it only has to be loaded once.
+
+Both sides of a connection first prove that they know a shared authentication key (an HMAC challenge in each
+direction), and nothing is unpickled until they have. After that, messages are pickled lists of operations, prefixed
+with their length. Each message is answered with a list of results in the same order, and a client may send several
+messages before reading the answers (pipelining).
+"""
+from pyntree import Node
+from pyntree.errors import Error
+from pyntree.file import File
+from pyntree.table import Row
+from copy import deepcopy
+from typing import Any, Callable, List, Tuple, Union
+import hmac
+import os
+import pickle
+import socket
+import socketserver
+import stat
+import struct
+import threading
+
+HEADER = struct.Struct('>I')
+MUTATING = ('set', 'delete', 'inplace')
+INPLACE = ('add', 'sub', 'mul', 'truediv', 'floordiv', 'mod', 'pow')
+AUTHKEY_VARIABLE = 'PYNTREE_AUTHKEY'
+NONCE_SIZE = 32
+SERVER = b'server'
+CLIENT = b'client'
+
+
+def get_authkey(authkey: Union[str, bytes, None]) -> bytes:
+    """
+    :param authkey: The key, or None to read it from the PYNTREE_AUTHKEY environment variable
+    :return: The key as bytes
+    """
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_VARIABLE)
+    if not authkey:
+        raise ValueError(f"An authentication key is required. Pass authkey or set {AUTHKEY_VARIABLE}.")
+    return authkey.encode() if type(authkey) is str else authkey
+
+
+def authenticate(sock: socket.socket, file, authkey: bytes, role: bytes) -> None:
+    """
+    Challenges the other side to prove it knows the key, and answers its challenge. The role is mixed into each
+    answer, so that a challenge can't be sent back to its sender to get it answered.
+    :param sock: The connected socket
+    :param file: A buffered file object wrapping the socket
+    :param authkey: The shared key
+    :param role: SERVER or CLIENT
+    :return:
+    """
+    nonce = os.urandom(NONCE_SIZE)
+    sock.sendall(nonce)
+    challenge = file.read(NONCE_SIZE)
+    sock.sendall(hmac.new(authkey, role + challenge, 'sha256').digest())
+    other = CLIENT if role == SERVER else SERVER
+    expected = hmac.new(authkey, other + nonce, 'sha256').digest()
+    if len(challenge) < NONCE_SIZE or not hmac.compare_digest(file.read(len(expected)), expected):
+        raise Error.AuthenticationFailed('The other side of the connection does not have the same authentication key.')
+
+
+def send(sock: socket.socket, message) -> None:
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def receive(file) -> Any:
+    """
+    :param file: A buffered file object wrapping the socket
+    :return: The next message, or None if the connection has been closed
+    """
+    header = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    return pickle.loads(file.read(HEADER.unpack(header)[0]))
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        try:
+            authenticate(self.request, self.rfile, self.server.authkey, SERVER)
+        except (Error.AuthenticationFailed, OSError):
+            return
+        while True:
+            message = receive(self.rfile)
+            if message is None:
+                break
+            send(self.request, self.server.store.execute(message))
+
+
+class Store:
+    """
+    Owns the File being served, applies operations to it, and coalesces saves: changes mark the data as dirty, and it
+    is saved at most once per save interval (or when a client asks for a save).
+    """
+
+    def __init__(self, file: File, save_interval: float) -> None:
+        self.file = file
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.stopped = threading.Event()
+        self.saver = threading.Thread(target=self.save_periodically, daemon=True)
+        self.saver.start()
+
+    def execute(self, operations: List[Tuple[str, list, tuple, dict]]) -> List[Tuple[bool, Any]]:
+        """
+        Applies the operations of a message atomically: no other message is handled in between, and if an operation
+        fails, the changes made by the ones before it are undone and the rest are skipped.
+        :param operations: A list of (operation, path, args, kwargs) tuples
+        :return: A (success, result or exception) tuple for each operation up to and including the first failure
+        """
+        results = []
+        undo = []
+        with self.lock:
+            for operation, path, args, kwargs in operations:
+                try:
+                    node = Node(self.file)
+                    for name in path:  # Raises the same errors a local Node would for missing names
+                        node = node.get(name)
+                    if operation in MUTATING:
+                        undo.append(self.undo(operation, node, args))
+                    results.append((True, self.apply(operation, node, args, kwargs)))
+                except Exception as e:
+                    results.append((False, e))
+                    for step in reversed(undo):
+                        step()
+                    break
+        return results
+
+    def undo(self, operation: str, node: Node, args: tuple) -> Callable[[], None]:
+        """
+        Records what a mutating operation is about to change.
+        :return: A function which puts it back
+        """
+        if operation == 'delete' and not args and not node.path:  # Deleting everything
+            data = self.file.resolve()
+            return lambda: setattr(self.file, 'data', data)
+        if operation == 'set' or (operation == 'delete' and args):
+            path, names = node.path, args[:-1] if operation == 'set' else args
+        else:  # Deleting the Node itself, or changing its value in place
+            path, names = node.path[:-1], node.path[-1:]
+        target = self.file.resolve(*path)
+        previous = {}
+        for name in names:
+            if name in target:
+                value = target[name]
+                if isinstance(value, Row):  # A view, which would show the new values
+                    value = dict(value)
+                previous[name] = deepcopy(value) if operation == 'inplace' else value  # += can change lists in place
+
+        def restore() -> None:
+            for name in names:
+                if name in previous:
+                    target[name] = previous[name]
+                else:
+                    target.pop(name, None)
+                self.file.invalidate(*path, name)
+        return restore
+
+    def apply(self, operation: str, node: Node, args: tuple, kwargs: dict) -> Any:
+        if operation in MUTATING:
+            self.dirty = True
+        if operation == 'get':  # The value is only pickled, never changed, so the cached hashes stay valid
+            return node._get()
+        elif operation == 'set':
+            return node.set(*args)
+        elif operation == 'delete':
+            return node.delete(*args)
+        elif operation == 'inplace':  # Applied here, under the lock, so that concurrent updates aren't lost
+            if args[0] not in INPLACE:
+                raise ValueError(f"Unknown in-place operation '{args[0]}'")
+            getattr(node, f'__i{args[0]}__')(args[1])
+            return node._get()
+        elif operation == 'has':
+            return node.has(*args)
+        elif operation == 'values':
+            return node._values
+        elif operation == 'where':
+            return [child._name for child in node.where(**kwargs)]
+        elif operation == 'containing':
+            return [child._name for child in node.containing(*args)]
+        elif operation == 'save':
+            return self.save()
+        raise ValueError(f"Unknown operation '{operation}'")
+
+    def save(self) -> None:
+        """
+        Saves the file if it has changed. The lock must be held.
+        """
+        if self.dirty and self.file.name:
+            self.file.save()
+            self.dirty = False
+
+    def save_periodically(self) -> None:
+        while not self.stopped.wait(self.save_interval):
+            with self.lock:
+                self.save()
+
+    def close(self) -> None:
+        self.stopped.set()
+        self.saver.join()
+        with self.lock:
+            self.save()
+
+
+class Server:
+    def __init__(
+            self,
+            file: Union[File, str],
+            address: Union[str, Tuple[str, int]],
+            save_interval: float = 1.0,
+            authkey: Union[str, bytes] = None,
+            **file_args
+    ) -> None:
+        """
+        Serves a File to RemoteNode clients. Call serve_forever to start handling requests.
+
+        :param file: The File to serve, or the filename to load
+        :param address: The path of a Unix socket, or a (host, port) tuple for TCP (use port 0 for any free port)
+        :param save_interval: The maximum number of seconds to wait before saving changes
+        :param authkey: The key clients must know to connect (default: the PYNTREE_AUTHKEY environment variable)
+        :param file_args: Additional keyword arguments to pass to the File object (see the File class)
+        """
+        authkey = get_authkey(authkey)
+        if type(address) is str and os.path.exists(address):
+            remove_stale_socket(address)
+        file = file if type(file) is File else File(file, **file_args)
+        file.autosave = False  # Saves are coalesced by the Store instead
+        self.store = Store(file, save_interval)
+        if type(address) is str:
+            self.server = socketserver.ThreadingUnixStreamServer(address, Handler)
+        else:
+            self.server = socketserver.ThreadingTCPServer(address, Handler)
+        self.server.daemon_threads = True
+        self.server.store = self.store
+        self.server.authkey = authkey
+        self.address = self.server.server_address
+
+    def serve_forever(self) -> None:
+        self.server.serve_forever()
+
+    def shutdown(self) -> None:
+        """
+        Stops serve_forever (call it from another thread) and closes the server
+        """
+        self.server.shutdown()
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes the socket and saves any remaining changes
+        """
+        self.server.server_close()
+        self.store.close()
+        if type(self.address) is str and os.path.exists(self.address) and is_socket(self.address):
+            os.remove(self.address)
+
+
+def is_socket(path: str) -> bool:
+    return stat.S_ISSOCK(os.stat(path).st_mode)
+
+
+def remove_stale_socket(path: str) -> None:
+    """
+    Removes a socket left behind by a server which wasn't shut down cleanly. Anything else at the path is left alone.
+    :param path: The path of the socket
+    :return:
+    """
+    if not is_socket(path):
+        raise FileExistsError(f"{path} already exists and is not a socket.")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:  # Nothing is listening, so it is stale
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise FileExistsError(f"Another server is already listening on {path}.")
+
+
+class Client:
+    """
+    A connection to a Server, shared by every RemoteNode spawned from the same root.
+    """
+
+    def __init__(self, address: Union[str, Tuple[str, int]], authkey: Union[str, bytes] = None) -> None:
+        """
+        :param address: The address of the Server
+        :param authkey: The key the server was started with (default: the PYNTREE_AUTHKEY environment variable)
+        """
+        authkey = get_authkey(authkey)
+        if type(address) is str:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.connect(address)
+        self.reader = self.socket.makefile('rb')
+        try:
+            authenticate(self.socket, self.reader, authkey, CLIENT)
+        except BaseException:
+            self.close()
+            raise
+        self.lock = threading.Lock()
+        self.queued = None  # A list of operations while batching
+
+    def request(self, *messages) -> List[List[Tuple[bool, Any]]]:
+        """
+        Sends every message before reading any of the answers.
+        :param messages: Lists of (operation, path, args, kwargs) tuples
+        :return: The results for each message
+        """
+        with self.lock:
+            for message in messages:
+                send(self.socket, message)
+            return [receive(self.reader) for _ in messages]
+
+    def call(self, operation: str, path: list, *args, **kwargs) -> Any:
+        """
+        Runs an operation on the server (or queues it when batching) and raises any exception it produced
+        """
+        if self.queued is not None:
+            if operation in MUTATING:
+                self.queued.append((operation, path, args, kwargs))
+                return None
+            self.flush()
+        success, result = self.request([(operation, path, args, kwargs)])[0][0]
+        if not success:
+            raise result
+        return result
+
+    def pipeline(self, operations: List[Tuple[str, list, tuple, dict]]) -> List[Any]:
+        """
+        Sends each operation as its own message without waiting for the previous answers, so they cost a single
+        round trip. Unlike a batch, the server applies them one at a time rather than atomically.
+        :param operations: A list of (operation, path, args, kwargs) tuples
+        :return: The result of each operation (the first exception is raised instead, once every answer has arrived)
+        """
+        self.flush()
+        results = [answer[0] for answer in self.request(*[[operation] for operation in operations])]
+        for success, result in results:
+            if not success:
+                raise result
+        return [result for _, result in results]
+
+    def flush(self) -> None:
+        """
+        Sends any queued operations as a single message
+        :return:
+        """
+        queued, self.queued = self.queued, ([] if self.queued is not None else None)
+        if queued:  # Sent as one message, so the server applies all of it or none of it
+            for success, result in self.request(queued)[0]:
+                if not success:
+                    raise result
+
+    def close(self) -> None:
+        self.reader.close()
+        self.socket.close()
+
+
+class Batch:
+    def __init__(self, client: Client) -> None:
+        self.client = client
+
+    def __enter__(self) -> 'Batch':
+        self.client.flush()
+        self.client.queued = []
+        return self
+
+    def __exit__(self, *args) -> None:
+        try:
+            self.client.flush()
+        finally:
+            self.client.queued = None
+
+
+class RemoteNode(object):
+    def __init__(
+            self,
+            client: Union[Client, str, Tuple[str, int]],
+            path: list = None,
+            authkey: Union[str, bytes] = None
+    ) -> None:
+        """
+        A RemoteNode works like a Node, but its data lives on a Server. Child RemoteNodes are created without asking
+        the server whether they exist, so a missing name is only reported once the RemoteNode is used.
+
+        :param client: The address of the Server (a Unix socket path or a (host, port) tuple), or a Client
+        :param path: The location of the data within the hierarchy
+        :param authkey: The key the server was started with (default: the PYNTREE_AUTHKEY environment variable)
+        """
+        self.__dict__['path'] = [] if not path else path  # __dict__ is used because __setattr__ has been overridden
+        self.__dict__['get'] = self.__getattr__
+        self.__dict__['set'] = self.__setattr__
+        self.__dict__['client'] = client if type(client) is Client else Client(client, authkey)
+
+    def __getattr__(self, name, *names) -> Union['RemoteNode', List['RemoteNode']]:
+        requested = [RemoteNode(self.client, self.path + [n]) for n in (name,) + names]
+        return requested if len(requested) > 1 else requested[0]
+
+    def __setattr__(self, *args) -> None:
+        if not len(args) >= 2:
+            raise TypeError("You must specify at least 1 name and a value for the set method.")
+        value = args[-1]
+        if len(args) == 2 and isinstance(value, RemoteNode) and value.path == self.path + [args[0]]:
+            return  # The result of an in-place operation (e.g. r.a += 1), which the server has already applied
+        if isinstance(value, RemoteNode):
+            raise TypeError("A RemoteNode can't be stored, since it only refers to data through this client's "
+                            "connection. Store its value instead (e.g. r.b = r.a()).")
+        self.client.call('set', self.path, *args)
+
+    def __call__(self) -> Any:
+        return self.client.call('get', self.path)
+
+    def __getitem__(self, item):
+        return self.get(item)()
+
+    def __iter__(self):
+        for k in self._values:
+            yield k, self.get(k)()
+
+    def __str__(self):
+        return str(self())
+
+    def __repr__(self):
+        return f'RemoteNode({self.path})'
+
+    # Custom operations
+    def delete(self, *names) -> None:
+        self.client.call('delete', self.path, *names)
+
+    def has(self, *items) -> bool:
+        return self.client.call('has', self.path, *items)
+
+    def where(self, **kwargs) -> List['RemoteNode']:
+        return [RemoteNode(self.client, self.path + [name]) for name in self.client.call('where', self.path, **kwargs)]
+
+    def containing(self, *args) -> List['RemoteNode']:
+        names = self.client.call('containing', self.path, *args)
+        return [RemoteNode(self.client, self.path + [name]) for name in names]
+
+    def fetch(self, *nodes: 'RemoteNode') -> List[Any]:
+        """
+        Reads several RemoteNodes (sharing this one's connection) in a single round trip, using pipelining
+        :param nodes: The RemoteNodes to read
+        :return: Their values, in the same order
+        """
+        return self.client.pipeline([('get', node.path, (), {}) for node in nodes])
+
+    def save(self) -> None:
+        """
+        Asks the server to save any changes now, instead of waiting for its next save
+        """
+        self.client.call('save', self.path)
+
+    def batch(self) -> Batch:
+        """
+        Queues changes (set and delete) made inside a with block, and sends them to the server as one message, which
+        the server applies atomically. Reading a value inside the block sends the changes queued so far first.
+        """
+        return Batch(self.client)
+
+    # Properties
+    @property
+    def _values(self) -> List[str]:
+        return self.client.call('values', self.path)
+
+    @property
+    def _children(self) -> List['RemoteNode']:
+        return [self.get(n) for n in self._values]
+
+    @property
+    def _name(self) -> str:
+        return self.path[-1] if self.path else 'None'
+
+    @property
+    def _val(self) -> Any:
+        return self()
+
+    # Arithmetic operations - applied atomically by the server
+    def _inplace(self, operation: str, other) -> 'RemoteNode':
+        self.client.call('inplace', self.path, operation, other)
+        return self
+
+    def __iadd__(self, other):
+        return self._inplace('add', other)
+
+    def __isub__(self, other):
+        return self._inplace('sub', other)
+
+    def __imul__(self, other):
+        return self._inplace('mul', other)
+
+    def __itruediv__(self, other):
+        return self._inplace('truediv', other)
+
+    def __ifloordiv__(self, other):
+        return self._inplace('floordiv', other)
+
+    def __imod__(self, other):
+        return self._inplace('mod', other)
+
+    def __ipow__(self, other):
+        return self._inplace('pow', other)
+
+    # Comparison methods (<, >, <=, >=, ==, !=)
+    def _pair(self, other) -> Tuple[Any, Any]:
+        if isinstance(other, RemoteNode) and other.client is self.client:
+            return tuple(self.fetch(self, other))
+        return self(), other()
+
+    def __lt__(self, other):
+        first, second = self._pair(other)
+        return first < second
+
+    def __le__(self, other):
+        first, second = self._pair(other)
+        return first <= second
+
+    def __gt__(self, other):
+        first, second = self._pair(other)
+        return first > second
+
+    def __ge__(self, other):
+        first, second = self._pair(other)
+        return first >= second
+
+    def __eq__(self, other):
+        first, second = self._pair(other)
+        return first == second
+
+    def __ne__(self, other):
+        first, second = self._pair(other)
+        return first != second
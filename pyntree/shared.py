@@ -0,0 +1,103 @@
+from pyntree.incremental import LazyDict
+import pickle
+import struct
+
+try:
+    from multiprocessing.shared_memory import SharedMemory  # Python 3.8+
+    SUPPORTED = True
+except ImportError:
+    SUPPORTED = False
+    from pyntree.errors import Error
+
+HEADER = struct.Struct('<Q')  # The length of the pickled index, which follows the header
+
+
+class Snapshot:
+    """
+    A read-only copy of a Node's data, stored in shared memory so that other processes can read it without each
+    receiving (and unpickling) their own copy. Every top-level value is pickled separately and only unpickled when a
+    process first accesses it, straight from the shared buffer.
+
+    Pickling a Snapshot only sends its name, so it can be passed to pool workers as cheaply as a string.
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        Attaches to a snapshot which has already been published. Use Snapshot.publish to create one.
+        :param name: The name of the shared memory block
+        """
+        check()
+        self.name = name
+        self.owner = False
+        self.memory = SharedMemory(name=name)
+        self.offset = HEADER.size + HEADER.unpack_from(self.memory.buf)[0]  # Where the values start
+        self.index = pickle.loads(self.memory.buf[HEADER.size:self.offset])
+
+    @classmethod
+    def publish(cls, data: dict) -> 'Snapshot':
+        """
+        Copies the data into a new shared memory block.
+        :param data: The dictionary to share
+        :return: The owning Snapshot, which is responsible for freeing the memory with close()
+        """
+        check()
+        blobs = [(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) for key, value in data.items()]
+        index = []
+        offset = 0
+        for key, blob in blobs:
+            index.append((key, offset, offset + len(blob)))
+            offset += len(blob)
+        index = pickle.dumps(index, pickle.HIGHEST_PROTOCOL)
+
+        start = HEADER.size + len(index)
+        memory = SharedMemory(create=True, size=max(start + offset, 1))
+        HEADER.pack_into(memory.buf, 0, len(index))
+        memory.buf[HEADER.size:start] = index
+        for key, blob in blobs:
+            memory.buf[start:start + len(blob)] = blob
+            start += len(blob)
+        memory.close()
+
+        snapshot = cls(memory.name)
+        snapshot.owner = True
+        return snapshot
+
+    def read(self, start: int, end: int) -> memoryview:
+        """
+        :param start: The offset of the value, relative to the end of the index
+        :param end: The offset the value ends at, relative to the end of the index
+        :return: A view of the value's bytes in shared memory (no copy is made)
+        """
+        return self.memory.buf[self.offset + start:self.offset + end]
+
+    def data(self) -> dict:
+        """
+        :return: A dictionary which unpickles each value from shared memory when it is first accessed
+        """
+        return LazyDict(self.read, self.index, decode=pickle.loads)
+
+    def close(self) -> None:
+        """
+        Detaches from the shared memory, and frees it if this process published the snapshot.
+        Values which have already been accessed remain usable.
+        :return:
+        """
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def __enter__(self) -> 'Snapshot':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __reduce__(self):  # Other processes attach by name instead of receiving a copy
+        return Snapshot, (self.name,)
+
+
+def check():  # Determine whether shared memory is available
+    if not SUPPORTED:
+        raise Error.SharedMemoryNotAvailable(
+            'Shared memory snapshots require multiprocessing.shared_memory, which was added in Python 3.8.'
+        )
@@ -0,0 +1,231 @@
+from pyntree.errors import Error
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, List, Union
+from array import array, typecodes
+import json
+
+TYPECODES = {  # Python types which can be used in a schema instead of array typecodes
+    int: 'q',
+    float: 'd'
+}
+OBJECT = 'O'  # Columns of any other type are stored in a plain list
+JSON_MARKER = '__pyntree_table__'
+YAML_TAG = '!pyntree/table'
+
+
+def normalize_schema(schema: Dict[str, Union[str, type]]) -> Dict[str, str]:
+    """
+    :param schema: A dictionary of field names and their types, either as Python types or array typecodes
+    :return: The schema, with every type converted to an array typecode (or 'O' for list-backed columns)
+    """
+    normalized = {}
+    for field, kind in schema.items():
+        if kind in TYPECODES:
+            kind = TYPECODES[kind]
+        elif type(kind) is not str or len(kind) != 1 or kind not in typecodes:
+            kind = OBJECT
+        normalized[field] = kind
+    return normalized
+
+
+class Table(MutableMapping):
+    """
+    A collection of records which all have the same fields, stored as one typed column per field instead of a
+    dictionary per record. Numeric fields are kept in array.array objects (8 bytes per value for int/float), which
+    also pickle as raw bytes, so large collections take up several times less memory and save/load much faster.
+
+    Tables are used like any other dictionary inside a Node:
+
+        db.users = Table({'age': int, 'score': float, 'name': str})
+        db.users.u1 = {'age': 20, 'score': 1.5, 'name': 'Ann'}
+        db.users.u1.age()  # 20
+    """
+
+    def __init__(self, schema: Dict[str, Union[str, type]], rows: Mapping = None) -> None:
+        """
+        :param schema: The fields of each record and their types. Use int, float, an array typecode (such as 'i' for
+        32-bit integers or 'f' for 32-bit floats) or any other type for list-backed columns.
+        :param rows: Optional records to add, as a dictionary of {key: record}
+        """
+        self.schema = normalize_schema(schema)
+        self.row_keys = []
+        self.index = {}
+        self.columns = {
+            field: [] if kind == OBJECT else array(kind) for field, kind in self.schema.items()
+        }
+        if rows:
+            for key, record in rows.items():
+                self[key] = record
+
+    @classmethod
+    def from_columns(cls, schema: Dict[str, str], keys: List[Any], columns: Dict[str, Any]) -> 'Table':
+        """
+        Builds a Table directly from its columns, without going through each record.
+        :param schema: The schema of the table
+        :param keys: The key of each row, in order
+        :param columns: A dictionary of each field and a sequence of its values, in the same order as keys
+        :return: The new Table
+        """
+        table = cls(schema)
+        table.row_keys = list(keys)
+        table.index = {key: i for i, key in enumerate(table.row_keys)}
+        for field, kind in table.schema.items():
+            if len(columns[field]) != len(table.row_keys):
+                raise Error.SchemaMismatch(f"Column '{field}' does not have one value per key.")
+            table.columns[field] = list(columns[field]) if kind == OBJECT else array(kind, columns[field])
+        return table
+
+    def column(self, field: str) -> Union[array, list]:
+        """
+        :param field: The field to return
+        :return: The column storing the field. It must not be resized.
+        """
+        return self.columns[field]
+
+    # Mapping interface
+    def __getitem__(self, key) -> 'Row':
+        if key not in self.index:
+            raise KeyError(key)
+        return Row(self, key)
+
+    def __setitem__(self, key, record: Mapping) -> None:
+        if not isinstance(record, Mapping) or set(record.keys()) != set(self.schema):
+            raise Error.SchemaMismatch(f"Records in this table must have exactly the fields {list(self.schema)}.")
+        if key in self.index:
+            i = self.index[key]
+            previous = {field: self.columns[field][i] for field in self.schema}
+            for n, field in enumerate(self.schema):
+                try:
+                    self.columns[field][i] = record[field]
+                except (TypeError, OverflowError):  # Undo the partial write, so that the record isn't left half-changed
+                    for written in list(self.schema)[:n]:
+                        self.columns[written][i] = previous[written]
+                    raise
+        else:
+            for n, field in enumerate(self.schema):
+                try:
+                    self.columns[field].append(record[field])
+                except (TypeError, OverflowError):  # Undo the partial append, so that every column keeps the same length
+                    for added in list(self.schema)[:n]:
+                        self.columns[added].pop()
+                    raise
+            self.index[key] = len(self.row_keys)
+            self.row_keys.append(key)
+
+    def __delitem__(self, key) -> None:
+        i = self.index.pop(key)
+        del self.row_keys[i]
+        for column in self.columns.values():
+            del column[i]
+        for moved in self.row_keys[i:]:
+            self.index[moved] -= 1
+
+    def __contains__(self, key) -> bool:
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.row_keys)
+
+    def __len__(self) -> int:
+        return len(self.row_keys)
+
+    # Serialization
+    def to_dict(self) -> dict:
+        """
+        :return: The table's schema, keys and columns (as lists) in a plain dictionary
+        """
+        return {
+            'schema': self.schema,
+            'keys': self.row_keys,
+            'columns': {field: list(column) for field, column in self.columns.items()}
+        }
+
+    def __reduce__(self):  # Typed columns pickle as raw bytes
+        return Table.from_columns, (self.schema, self.row_keys, self.columns)
+
+    def __repr__(self) -> str:  # Used when saving to txt files, so it must evaluate back to a Table
+        data = self.to_dict()
+        return f"Table.from_columns({data['schema']!r}, {data['keys']!r}, {data['columns']!r})"
+
+
+class Row(MutableMapping):
+    """
+    A view of one record in a Table. Changes made through it are written to the table's columns.
+    """
+
+    def __init__(self, table: Table, key) -> None:
+        self.table = table
+        self.key = key
+
+    def __getitem__(self, field) -> Any:
+        return self.table.columns[field][self.table.index[self.key]]
+
+    def __setitem__(self, field, value) -> None:
+        if field not in self.table.schema:
+            raise Error.SchemaMismatch(f"'{field}' is not a field of this table.")
+        self.table.columns[field][self.table.index[self.key]] = value
+
+    def __delitem__(self, field) -> None:
+        raise Error.SchemaMismatch("Fields cannot be removed from a single record of a table.")
+
+    def __iter__(self):
+        return iter(self.table.schema)
+
+    def __len__(self) -> int:
+        return len(self.table.schema)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    def __reduce__(self):  # Pickle only this record, not the whole table
+        return dict, (dict(self),)
+
+
+# JSON & YAML support
+def json_default(obj) -> dict:
+    """
+    Passed to json.dumps to encode Tables
+    """
+    if isinstance(obj, Table):
+        return {JSON_MARKER: obj.to_dict()}
+    if isinstance(obj, Row):
+        return dict(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def json_object_hook(obj: dict) -> Any:
+    if JSON_MARKER in obj and len(obj) == 1:
+        data = obj[JSON_MARKER]
+        return Table.from_columns(data['schema'], data['keys'], data['columns'])
+    return obj
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    """
+    json.loads, but decodes Tables as well. The decoding hook is only used when the data contains a Table,
+    since it slows down decoding considerably.
+    """
+    marker = JSON_MARKER if type(data) is str else JSON_MARKER.encode()
+    if marker in data:
+        return json.loads(data, object_hook=json_object_hook)
+    return json.loads(data)
+
+
+def yaml_representer(dumper, table: Table):
+    return dumper.represent_mapping(YAML_TAG, table.to_dict())
+
+
+def yaml_constructor(loader, node):
+    data = loader.construct_mapping(node, deep=True)
+    return Table.from_columns(data['schema'], data['keys'], data['columns'])
+
+
+def register_yaml(*classes) -> None:
+    """
+    Teaches the given YAML Loaders and Dumpers how to handle Tables
+    """
+    for cls in classes:
+        if hasattr(cls, 'add_representer'):
+            cls.add_representer(Table, yaml_representer)
+        if hasattr(cls, 'add_constructor'):
+            cls.add_constructor(YAML_TAG, yaml_constructor)
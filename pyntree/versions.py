@@ -0,0 +1,129 @@
+from pyntree import encryption
+from pyntree.diff import HashNode
+from hashlib import blake2b
+from typing import Any, Dict, List, Tuple
+import pickle
+import sqlite3
+import time
+
+PROTOCOL = 4  # Fixed so that equal subtrees always produce the same object
+VALUE = 0  # An entry whose value is stored inside its parent's object
+TREE = 1  # An entry which is a dictionary, stored as its own object
+
+
+class VersionStore:
+    """
+    Stores snapshots of a File's data as a tree of content-addressed objects, one for each dictionary. Since an
+    object's address is the hash of its contents, a subtree which hasn't changed between snapshots is stored once
+    and shared, so each snapshot only adds the dictionaries which changed (and their parents).
+    """
+
+    def __init__(self, filename: str, password: str = None, salt: bytes = b'pyntree_default') -> None:
+        """
+        :param filename: The SQLite file to store the versions in (it will be created if it doesn't exist)
+        :param password: (Requires optional encryption depencies) Password to protect the stored objects with
+        :param salt: Optional salt for the encryption process
+        """
+        self.password = password
+        self.salt = salt
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS objects (hash BLOB PRIMARY KEY, data BLOB NOT NULL)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS versions "
+            "(version INTEGER PRIMARY KEY AUTOINCREMENT, root BLOB NOT NULL, time REAL NOT NULL, added INTEGER NOT NULL)"
+        )
+        self.connection.commit()
+
+    def _has(self, address: bytes) -> bool:
+        return bool(self.connection.execute("SELECT 1 FROM objects WHERE hash = ?", (address,)).fetchone())
+
+    def _put(self, tree, cache: HashNode = None) -> Tuple[bytes, int]:
+        """
+        Stores a dictionary and all of the dictionaries inside it.
+        :param cache: The dictionary's cache, which remembers its address until it is invalidated. Subtrees with a
+        remembered address which is already stored are skipped without being read.
+        :return: The hash of the dictionary's object, and the number of objects which weren't already stored
+        """
+        if cache is not None and cache.address is not None and self._has(cache.address):
+            return cache.address, 0
+        entries = []
+        added = 0
+        for key, value in tree.items():
+            if type(value) is dict:
+                address, new = self._put(value, None if cache is None else cache.child(key))
+                entries.append((key, TREE, address))
+                added += new
+            else:
+                entries.append((key, VALUE, value))
+        data = pickle.dumps(entries, PROTOCOL)
+        address = blake2b(data, digest_size=20).digest()
+        if not self._has(address):
+            if self.password:
+                encryption.check()
+                data = encryption.encrypt(data, self.password, self.salt)
+            self.connection.execute("INSERT INTO objects (hash, data) VALUES (?, ?)", (address, data))
+            added += 1
+        if cache is not None:
+            cache.address = address
+        return address, added
+
+    def _get(self, address: bytes) -> list:
+        """
+        :return: The entries of a single object, without loading the objects it refers to
+        """
+        data = self.connection.execute("SELECT data FROM objects WHERE hash = ?", (address,)).fetchone()[0]
+        if self.password:
+            encryption.check()
+            data = encryption.decrypt(data, self.password, self.salt)
+        return pickle.loads(data)
+
+    def _build(self, address: bytes) -> dict:
+        return {key: self._build(value) if kind == TREE else value for key, kind, value in self._get(address)}
+
+    def snapshot(self, data, cache: HashNode = None) -> int:
+        """
+        :param data: The dictionary to store
+        :param cache: The data's cache (see _put), if it is kept between snapshots
+        :return: The number of the new version
+        """
+        root, added = self._put(data, cache)
+        cursor = self.connection.execute(
+            "INSERT INTO versions (root, time, added) VALUES (?, ?, ?)", (root, time.time(), added)
+        )
+        self.connection.commit()
+        return cursor.lastrowid
+
+    def versions(self) -> List[Dict[str, Any]]:
+        """
+        :return: The number, time and root hash of every version, along with how many new objects it stored
+        """
+        return [
+            {'version': version, 'time': when, 'root': root.hex(), 'added': added}
+            for version, root, when, added in self.connection.execute(
+                "SELECT version, root, time, added FROM versions ORDER BY version"
+            )
+        ]
+
+    def load(self, version: int, *path) -> Any:
+        """
+        Reads a version, or part of one. Only the objects along the path and inside the requested subtree are read.
+        :param version: The number of the version to read
+        :param path: The names leading to the subtree to read (the whole version if empty)
+        :return: The data stored at the path
+        """
+        row = self.connection.execute("SELECT root FROM versions WHERE version = ?", (version,)).fetchone()
+        if not row:
+            raise KeyError(f"Version {version} does not exist")
+        kind, value = TREE, row[0]
+        for depth, name in enumerate(path):
+            if kind != TREE:
+                raise KeyError(f"{'.'.join(map(str, path[:depth]))} is not a dictionary in version {version}")
+            for key, kind, value in self._get(value):
+                if key == name:
+                    break
+            else:
+                raise KeyError(f"{'.'.join(map(str, path[:depth + 1]))} does not exist in version {version}")
+        return self._build(value) if kind == TREE else value
+
+    def close(self) -> None:
+        self.connection.close()
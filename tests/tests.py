@@ -1,7 +1,19 @@
 import unittest
-from pyntree import Node
+from pyntree import Node, Table, stream, attach
 from pyntree.file import EXTENSIONS
+from pyntree.incremental import scan_json, LazyDict
+from pyntree import columns
+from pyntree.errors import Error
+from pyntree.handles import POOL
+from pyntree.server import Server, RemoteNode
+from pyntree import diff
 import os
+import json
+import pickle
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime as dt
 
 os.chdir("..")
@@ -325,6 +337,689 @@ class FileScanningTests(unittest.TestCase):
         self.assertEqual(str(dict(db)), str({'a': {'b': {'c': 1}}}))
 
 
+class IncrementalLoadingTests(unittest.TestCase):
+    def test_stream(self):
+        for item in BASIC_FILES[2:]:
+            with self.subTest(msg=item):
+                pairs = list(stream(item))
+                self.assertEqual([k for k, v in pairs], ['a', 'b'])
+                self.assertEqual(pairs[1][1].c(), 2)
+                self.assertEqual(pairs[0][1]._name, 'a')
+
+    def test_stream_encrypted(self):
+        self.assertEqual(dict((k, v()) for k, v in stream(ENCRYPTED_FILES[1], password='testing')),
+                         {'a': 1, 'b': {'c': 2}})
+
+    def test_scan_json(self):
+        data = r' {"a": "}{,:\\\"", "b" : [1, {"c": [2]}], "cé": {"d": "é"} }'.encode()
+        index = list(scan_json(data))
+        self.assertEqual([i[0] for i in index], ['a', 'b', 'cé'])
+        self.assertEqual([json.loads(data[s:e]) for _, s, e in index], ['}{,:\\"', [1, {'c': [2]}], {'d': 'é'}])
+
+    def test_lazy(self):
+        db = Node('tests/sample.json', lazy=True)
+        self.assertIs(type(db.file.data), LazyDict)
+        self.assertFalse(db.file.data.loaded)
+        self.assertEqual(db.b.c(), 2)
+        self.assertFalse(db.file.data.loaded)  # Only 'b' has been parsed
+        self.assertEqual(db(), {'a': 1, 'b': {'c': 2}})
+
+    def test_lazy_save(self):
+        db = Node('tests/sample.json', lazy=True)
+        db.save('tests/testing_lazy.json')
+        self.assertEqual(Node('tests/testing_lazy.json')(), {'a': 1, 'b': {'c': 2}})
+        os.remove('tests/testing_lazy.json')
+
+    def test_lazy_save_yaml(self):
+        db = Node('tests/sample.json', lazy=True)
+        db.save('tests/testing_lazy.yml')
+        with open('tests/testing_lazy.yml') as f:
+            self.assertNotIn('!!python', f.read())
+        self.assertEqual(Node('tests/testing_lazy.yml')(), {'a': 1, 'b': {'c': 2}})
+        os.remove('tests/testing_lazy.yml')
+
+    def test_lazy_popitem(self):
+        data = Node('tests/sample.json', lazy=True).file.data
+        self.assertEqual(data.popitem(), ('b', {'c': 2}))
+
+    def test_lazy_other_writer(self):
+        Node({'a': 1, 'b': {'c': 2}}).save('tests/testing_lazy.json')
+        lazy = Node('tests/testing_lazy.json', lazy=True)
+        writer = Node('tests/testing_lazy.json')
+        writer.a = 'a much longer value than before'
+        writer.save()
+        self.assertEqual(lazy(), {'a': 1, 'b': {'c': 2}})  # Loaded before the file was overwritten
+
+        lazy = Node('tests/testing_lazy.json', lazy=True)
+        with open('tests/testing_lazy.json', 'w') as f:  # Written by something else
+            f.write('{"b": {"c": 3}}')
+        with self.assertRaises(Error.FileChanged):
+            lazy.a()
+        lazy.file.reload()
+        self.assertEqual(lazy.b.c(), 3)
+        os.remove('tests/testing_lazy.json')
+
+    def test_lazy_eq(self):
+        self.assertEqual(Node('tests/sample.json', lazy=True), Node('tests/sample.json', lazy=True))
+
+
+class ParallelTests(unittest.TestCase):
+    def setUp(self):
+        self.db = Node({'c': 'ccc', 'a': 'a', 'b': 'bb'})
+
+    def test_map(self):
+        for executor in ('thread', 'process'):
+            with self.subTest(msg=executor):
+                results = self.db.map(len, executor=executor, workers=2)
+                self.assertEqual(list(results.items()), [('c', 3), ('a', 1), ('b', 2)])
+
+    def test_map_existing_executor(self):
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(self.db.map(str.upper, executor=executor, chunksize=2)['b'], 'BB')
+
+    def test_map_update(self):
+        self.db.map(len, executor='thread', update=True)
+        self.assertEqual(self.db(), {'c': 3, 'a': 1, 'b': 2})
+
+    def test_filter(self):
+        matches = self.db.filter(str.isupper, executor='thread')
+        self.assertEqual(matches, [])
+        matches = self.db.filter(lambda v: len(v) > 1, executor='thread')
+        self.assertEqual([m._name for m in matches], ['c', 'b'])
+
+    def test_unknown_executor(self):
+        with self.assertRaises(ValueError):
+            self.db.map(len, executor='gpu')
+
+
+class ColumnTests(unittest.TestCase):
+    def setUp(self):
+        self.db = Node({
+            'u1': {'age': 20, 'score': 1.5, 'team': 'red'},
+            'u2': {'age': 30, 'score': 2.5, 'team': 'blue'},
+            'u3': {'age': 40, 'score': 3.5, 'team': 'red'},
+        })
+        self.numpy = columns.SUPPORTED
+
+    def tearDown(self):
+        columns.SUPPORTED = self.numpy
+
+    def backends(self):  # Run each test with NumPy (if installed) and with the array module fallback
+        for supported in {self.numpy, False}:
+            columns.SUPPORTED = supported
+            with self.subTest(msg='numpy' if supported else 'array'):
+                yield
+
+    def test_column(self):
+        for _ in self.backends():
+            self.assertEqual(list(self.db.column('age')), [20, 30, 40])
+            self.assertEqual(list(self.db.column('team')), ['red', 'blue', 'red'])
+
+    def test_to_columns(self):
+        for _ in self.backends():
+            extracted = self.db.to_columns(['age', 'score'])
+            self.assertEqual(list(extracted['score']), [1.5, 2.5, 3.5])
+
+    def test_aggregations(self):
+        for _ in self.backends():
+            self.assertEqual(self.db.sum('age'), 90)
+            self.assertEqual(self.db.mean('score'), 2.5)
+            self.assertEqual(self.db.count(), 3)
+            self.assertEqual(self.db.count('age'), 3)
+            self.assertEqual(self.db.count('height'), 0)
+
+    def test_group_by(self):
+        for _ in self.backends():
+            self.assertEqual(self.db.group_by('team', 'age'), {'red': 60, 'blue': 30})
+            self.assertEqual(self.db.group_by('team', 'score', agg='mean'), {'red': 2.5, 'blue': 2.5})
+            self.assertEqual(self.db.group_by('team', agg='count'), {'red': 2, 'blue': 1})
+
+    def test_large_integers(self):
+        db = Node({'a': {'x': 2 ** 70}, 'b': {'x': 1}})
+        for _ in self.backends():
+            self.assertEqual(db.sum('x'), 2 ** 70 + 1)
+            self.assertEqual(db.mean('x'), (2 ** 70 + 1) / 2)
+
+    def test_mixed_column(self):
+        db = Node({'a': {'x': 1}, 'b': {'x': 'y'}, 'c': {'x': None}})
+        for _ in self.backends():
+            self.assertEqual(list(db.column('x')), [1, 'y', None])
+            with self.assertRaises(TypeError):
+                db.sum('x')
+
+    def test_list_column(self):
+        for values in ([[1, 2], [3, 4]], [[1], [2, 3]]):
+            db = Node({'a': {'x': values[0]}, 'b': {'x': values[1]}})
+            for _ in self.backends():
+                column = db.column('x')
+                self.assertEqual(len(column), 2)
+                self.assertEqual(list(column), values)
+
+    def test_group_by_unorderable_keys(self):
+        self.db.u2.team = None
+        for _ in self.backends():
+            self.assertEqual(self.db.group_by('team', 'age'), {'red': 60, None: 30})
+            self.assertEqual(self.db.group_by('team', agg='count'), {'red': 2, None: 1})
+
+    def test_missing_field(self):
+        with self.assertRaises(AttributeError):
+            self.db.column('height')
+
+
+# noinspection PyCallingNonCallable
+class TableTests(unittest.TestCase):
+    def setUp(self):
+        self.db = Node({'users': Table({'age': int, 'score': 'f', 'team': str}, {
+            'u1': {'age': 20, 'score': 1.5, 'team': 'red'},
+            'u2': {'age': 30, 'score': 2.5, 'team': 'blue'},
+        })})
+
+    def test_get(self):
+        self.assertEqual(self.db.users.u1.age(), 20)
+        self.assertEqual(self.db.users.u2(), {'age': 30, 'score': 2.5, 'team': 'blue'})
+        self.assertEqual(self.db.users._values, ['u1', 'u2'])
+
+    def test_set(self):
+        self.db.users.u3 = {'age': 40, 'score': 3.5, 'team': 'red'}
+        self.db.users.u1.age = 21
+        self.db.users.u1.age += 1
+        self.assertEqual(self.db.users.u1.age(), 22)
+        self.assertEqual(self.db.users.column('age').tolist(), [22, 30, 40])
+
+    def test_schema_mismatch(self):
+        with self.assertRaises(Error.SchemaMismatch):
+            self.db.users.u3 = {'age': 40}
+        with self.assertRaises(TypeError):
+            self.db.users.u3 = {'age': 'forty', 'score': 3.5, 'team': 'red'}
+        self.assertEqual(len(self.db.users()), 2)
+        self.assertEqual(len(self.db.users().column('age')), 2)
+        with self.assertRaises(TypeError):
+            self.db.users.set('u1', {'age': 99, 'score': 'bad', 'team': 'red'})
+        self.assertEqual(self.db.users.u1(), {'age': 20, 'score': 1.5, 'team': 'red'})
+
+    def test_delete(self):
+        self.db.users.u1.delete()
+        self.assertEqual(self.db.users._values, ['u2'])
+        self.assertEqual(self.db.users.u2.age(), 30)
+
+    def test_where(self):
+        matches = self.db.users.where(team='blue')
+        self.assertEqual([m._name for m in matches], ['u2'])
+
+    def test_iter(self):
+        self.assertEqual([(k, v['age']) for k, v in self.db.users], [('u1', 20), ('u2', 30)])
+
+    def test_columns(self):
+        self.assertEqual(self.db.users.sum('age'), 50)
+        self.assertEqual(self.db.users.group_by('team', 'age'), {'red': 20, 'blue': 30})
+        self.assertEqual(self.db.users.count('age'), 2)
+
+    def test_pickle_row(self):
+        row = pickle.loads(pickle.dumps(self.db.users()['u1']))
+        self.assertEqual(row, {'age': 20, 'score': 1.5, 'team': 'red'})
+        self.assertIs(type(row), dict)
+
+    def test_save(self):
+        for ext in EXTENSIONS:
+            with self.subTest(msg=ext):
+                Node(self.db()).save(f'tests/testing_table.{ext}')
+                loaded = Node(f'tests/testing_table.{ext}')
+                self.assertIs(type(loaded.users()), Table)
+                self.assertEqual(loaded.users.u2.score(), 2.5)
+                self.assertEqual(loaded(), self.db())
+                os.remove(f'tests/testing_table.{ext}')
+
+
+class HandlePoolTests(unittest.TestCase):
+    def setUp(self):
+        self.limit = POOL.limit
+
+    def tearDown(self):
+        POOL.limit = self.limit
+
+    def test_limit(self):
+        POOL.limit = 2
+        databases = [Node(f'tests/testing_pool_{i}.json') for i in range(4)]
+        self.assertLessEqual(POOL.stats['open'], 2)
+        for i, db in enumerate(databases):  # Evicted handles are reopened on demand
+            db.i = i
+            db.save()
+            db.file.reload()
+            self.assertEqual(db.i(), i)
+        self.assertLessEqual(POOL.stats['open'], 2)
+        for i in range(4):
+            os.remove(f'tests/testing_pool_{i}.json')
+
+    def test_shared_handle(self):
+        first, second = Node('tests/sample.json'), Node('tests/sample.json')
+        self.assertIs(first.file.file, second.file.file)
+
+    def test_threads(self):
+        POOL.limit = 1
+        first, second = Node('tests/testing_pool_a.json'), Node('tests/testing_pool_b.json')
+        first.a = 1
+        errors = []
+
+        def save():
+            try:
+                for _ in range(200):
+                    first.save()
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=save)
+        thread.start()
+        for _ in range(200):  # Evicts the handle first is writing to, unless it is leased
+            second.file.reload()
+        thread.join()
+        self.assertEqual(errors, [])
+        first.file.reload()
+        self.assertEqual(first(), {'a': 1})
+        os.remove('tests/testing_pool_a.json')
+        os.remove('tests/testing_pool_b.json')
+
+    def test_shared_position(self):
+        first, second = Node('tests/sample.json', lazy=True), Node('tests/sample.json', lazy=True)
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda db: db.file.read_range(0, 10), [first, second] * 100))
+        self.assertEqual(set(results), {results[0]})
+
+    def test_save_as_keeps_handle(self):
+        db = Node('tests/testing_pool.pyn')
+        db.a = 1
+        handle = db.file.file
+        opens = POOL.stats['opens']
+        db.save(filename='tests/testing_pool.json')
+        self.assertIs(db.file.file, handle)
+        self.assertEqual(POOL.stats['opens'], opens)
+        self.assertEqual(Node('tests/testing_pool.json')(), {'a': 1})
+        os.remove('tests/testing_pool.pyn')
+        os.remove('tests/testing_pool.json')
+
+
+# noinspection PyCallingNonCallable
+class VersioningTests(unittest.TestCase):
+    def setUp(self):
+        self.db = Node('tests/testing_versions.pyn')
+        self.db.a = {'b': {'c': 1}, 'd': 2}
+        self.db.e = {'f': 3}
+
+    def tearDown(self):
+        del self.db
+        os.remove('tests/testing_versions.pyn')
+        os.remove('tests/testing_versions.pyn.versions')
+
+    def test_snapshot_restore(self):
+        first = self.db.file.snapshot()
+        self.db.a.b.c = 5
+        second = self.db.file.snapshot()
+        self.db.file.restore(first)
+        self.assertEqual(self.db.a.b.c(), 1)
+        self.db.file.restore(second)
+        self.assertEqual(self.db.a.b.c(), 5)
+
+    def test_deduplication(self):
+        self.db.file.snapshot()
+        self.db.a.b.c = 5  # Changes a.b, a, and the root, but not e
+        self.db.file.snapshot()
+        self.db.file.snapshot()
+        self.assertEqual([v['added'] for v in self.db.file.versions()], [4, 3, 0])
+
+    def test_unchanged_subtrees_skipped(self):
+        self.db.file.snapshot()
+        self.db.a.b.c = 5
+        self.assertIsNone(self.db.file.hash_node('a').address)
+        self.assertIsNotNone(self.db.file.hash_node('e').address)  # Unchanged, so it won't be stored again
+        self.db.file.snapshot()
+        self.assertEqual([v['added'] for v in self.db.file.versions()], [4, 3])
+
+    def test_snapshot_after_changes_in_place(self):
+        self.db.tags = ['a']
+        self.db.file.snapshot()
+        self.db.tags().append('b')
+        self.db.e().update(g=4)
+        self.db.file.data['a']['d'] = 3
+        self.db.file.get_nested('a', 'b')['c'] = 6
+        version = self.db.file.snapshot()
+        self.assertEqual(self.db.file.version_store().load(version), self.db())
+
+    def test_restore_subtree(self):
+        version = self.db.file.snapshot()
+        self.db.a.b.c = 5
+        self.db.e.f = 6
+        self.assertEqual(self.db.file.restore(version, 'a', 'b'), {'c': 1})
+        self.assertEqual(self.db(), {'a': {'b': {'c': 1}, 'd': 2}, 'e': {'f': 6}})
+        self.assertEqual(self.db.file.restore(version, 'a', 'd'), 2)
+
+    def test_missing(self):
+        version = self.db.file.snapshot()
+        with self.assertRaises(KeyError):
+            self.db.file.restore(version + 1)
+        with self.assertRaises(KeyError):
+            self.db.file.restore(version, 'a', 'z')
+
+
+# noinspection PyCallingNonCallable
+class ServerTests(unittest.TestCase):
+    def setUp(self):
+        Node({'a': 1, 'b': {'c': 2}, 'd': {'c': 3}}).save('tests/testing_server.pyn')
+        self.socket = os.path.join(tempfile.mkdtemp(), 'pyn.sock')
+        self.server = Server('tests/testing_server.pyn', self.socket, save_interval=60, authkey='secret')
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.db = RemoteNode(self.socket, authkey='secret')
+
+    def tearDown(self):
+        self.db.client.close()
+        self.server.shutdown()
+        os.remove('tests/testing_server.pyn')
+
+    def test_get(self):
+        self.assertEqual(self.db.a(), 1)
+        self.assertEqual(self.db.b.c(), 2)
+        self.assertEqual(self.db._values, ['a', 'b', 'd'])
+        self.assertTrue(self.db.has('b'))
+
+    def test_missing(self):
+        with self.assertRaises(AttributeError):
+            self.db.z()
+
+    def test_set_delete(self):
+        self.db.e = 5
+        self.db.b.c = 4
+        self.db.d.delete()
+        other = RemoteNode(self.socket, authkey='secret')  # Another client sees the same data
+        self.assertEqual(other(), {'a': 1, 'b': {'c': 4}, 'e': 5})
+        other.client.close()
+
+    def test_where(self):
+        self.db.users = {'u1': {'c': 2}, 'u2': {'c': 3}}
+        matches = self.db.users.where(c=3)
+        self.assertEqual([m._name for m in matches], ['u2'])
+        self.assertEqual(matches[0](), {'c': 3})
+
+    def test_batch(self):
+        with self.db.batch():
+            self.db.x = 1
+            self.db.y = 2
+            self.assertEqual(self.db.client.queued and len(self.db.client.queued), 2)
+        self.assertEqual(self.db.x() + self.db.y(), 3)
+
+    def test_batch_failure(self):
+        with self.assertRaises(AttributeError):
+            with self.db.batch():
+                self.db.x = 1
+                self.db.a = 5
+                self.db.b.delete('c')
+                self.db.zz.delete()  # Fails, so the changes before it are undone
+                self.db.y = 2
+        self.assertFalse(self.db.has('x') or self.db.has('y'))
+        self.assertEqual(self.db.a(), 1)
+        self.assertEqual(self.db.b.c(), 2)
+
+    def test_store_remote_node(self):
+        with self.assertRaises(TypeError):
+            self.db.z = self.db.a
+        self.db.z = self.db.a()
+        self.assertEqual(self.db.z(), 1)
+
+    def test_coalesced_save(self):
+        self.db.a = 10
+        self.db.a = 11
+        self.assertEqual(Node('tests/testing_server.pyn').a(), 1)  # Not saved yet
+        self.db.save()
+        self.assertEqual(Node('tests/testing_server.pyn').a(), 11)
+
+    def test_tcp(self):
+        server = Server('tests/testing_server.pyn', ('127.0.0.1', 0), authkey=b'secret')
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        db = RemoteNode(server.address, authkey=b'secret')
+        self.assertEqual(db.b.c(), 2)
+        db.client.close()
+        server.shutdown()
+
+    def test_authentication(self):
+        with self.assertRaises(Error.AuthenticationFailed):
+            RemoteNode(self.socket, authkey='wrong')
+        self.assertEqual(self.db.a(), 1)  # The server keeps serving other clients
+        with self.assertRaises(ValueError):
+            Server('tests/testing_server.pyn', ('127.0.0.1', 0), authkey='')
+
+    def test_existing_path(self):
+        with open('tests/testing_precious.pyn', 'wb') as f:
+            f.write(b'precious')
+        with self.assertRaises(FileExistsError):
+            Server('tests/testing_server.pyn', 'tests/testing_precious.pyn', authkey='secret')
+        with self.assertRaises(FileExistsError):  # A server is still listening there
+            Server('tests/testing_server.pyn', self.socket, authkey='secret')
+        with open('tests/testing_precious.pyn', 'rb') as f:
+            self.assertEqual(f.read(), b'precious')
+        os.remove('tests/testing_precious.pyn')
+
+    def test_inplace(self):
+        self.db.a += 1
+        self.db.a *= 10
+        self.assertEqual(self.db.a(), 20)
+        clients = [RemoteNode(self.socket, authkey='secret') for _ in range(4)]
+
+        def increment(db):
+            for _ in range(50):
+                db.a += 1
+
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(increment, clients))
+        self.assertEqual(self.db.a(), 220)  # No increments were lost
+        for db in clients:
+            db.client.close()
+
+    def test_compare(self):
+        self.assertTrue(self.db.a == self.db.a)
+        self.assertTrue(self.db.a < self.db.b.c)
+        self.assertFalse(self.db.b.c != self.db.b.c)
+        self.assertTrue(self.db.d.c >= self.db.b.c)
+
+    def test_containing(self):
+        self.db.users = {'u1': {'c': 2}, 'u2': {'e': 3}}
+        self.assertEqual([m._name for m in self.db.users.containing('c')], ['u1'])
+
+    def test_pipeline(self):
+        self.assertEqual(self.db.fetch(self.db.a, self.db.b.c, self.db.d), [1, 2, {'c': 3}])
+        answers = self.db.client.request([('get', ['a'], (), {})], [('get', ['z'], (), {})])
+        self.assertEqual(answers[0], [(True, 1)])
+        self.assertFalse(answers[1][0][0])
+        with self.assertRaises(AttributeError):
+            self.db.fetch(self.db.a, self.db.z)
+
+
+# noinspection PyCallingNonCallable
+class CacheTests(unittest.TestCase):
+    def setUp(self):
+        Node({str(i): {'value': i, 'padding': 'x' * 100} for i in range(10)}).save('tests/testing_cache.pyncache')
+        self.db = Node('tests/testing_cache.pyncache', cache_size=500)
+
+    def tearDown(self):
+        self.db.file.close_cache()
+        os.remove('tests/testing_cache.pyncache')
+
+    def test_eviction(self):
+        for i in range(10):
+            self.assertEqual(self.db.get(str(i)).value(), i)
+        stats = self.db.file.cache_stats
+        self.assertLessEqual(stats['resident_bytes'], 500)
+        self.assertGreater(stats['evictions'], 0)
+        self.assertEqual(stats['misses'], 10)
+
+    def test_hits(self):
+        self.db.get('1').value()
+        self.db.get('1').value()
+        self.assertEqual(self.db.file.cache_stats['misses'], 1)
+        self.assertGreater(self.db.file.cache_stats['hits'], 0)
+
+    def test_write_back(self):
+        self.db.get('0').value = 'changed'
+        for i in range(1, 10):  # Push '0' out of memory
+            self.db.get(str(i)).value()
+        self.assertNotIn('0', self.db.file.data.resident)
+        self.assertEqual(self.db.get('0').value(), 'changed')
+
+    def test_write_back_unlocks(self):
+        self.db.get('0').value = 'changed'
+        for i in range(1, 10):
+            self.db.get(str(i)).value()
+        other = Node('tests/testing_cache.pyncache')
+        self.assertEqual(other.get('0').value(), 'changed')
+        other.new = 1
+        other.save()  # Fails if the eviction left the file locked
+        other.file.close_cache()
+
+    def test_unsaved_delete(self):
+        self.db.delete('0')
+        self.db.new = 1
+        self.db.file.reload()  # Discards both changes
+        self.assertEqual(self.db.get('0').value(), 0)
+        self.assertFalse(self.db.has('new'))
+
+    def test_pickle_without_saving(self):
+        self.db.get('0').value = 'changed'
+        copy = pickle.loads(pickle.dumps(self.db))
+        self.assertEqual(copy.get('0').value(), 0)
+        copy.file.close_cache()
+
+    def test_replace_closes(self):
+        cache = self.db.file.data
+        self.db.delete()
+        with self.assertRaises(sqlite3.ProgrammingError):  # Closed
+            cache.connection.execute("SELECT 1")
+
+    def test_other_thread(self):
+        with ThreadPoolExecutor(1) as executor:
+            self.assertEqual(executor.submit(lambda: self.db.get('3').value()).result(), 3)
+
+    def test_stats(self):
+        self.assertIsNone(Node().file.cache_stats)
+        self.assertEqual(self.db.file.cache_stats['misses'], 0)
+
+    def test_save(self):
+        self.db.get('0').value = 'changed'
+        self.db.new = 1
+        self.db.delete('9')
+        self.db.save()
+        reloaded = Node('tests/testing_cache.pyncache')
+        self.assertEqual(reloaded.get('0').value(), 'changed')
+        self.assertEqual(reloaded.new(), 1)
+        self.assertFalse(reloaded.has('9'))
+        reloaded.file.data.close()
+
+    def test_ttl(self):
+        db = Node('tests/testing_cache.pyncache', cache_size=None, cache_ttl=0)
+        db.get('0').value()
+        db.get('1').value()
+        self.assertEqual(db.file.cache_stats['resident'], 1)
+        db.file.data.close()
+
+    def test_export(self):
+        self.assertEqual(self.db(), {str(i): {'value': i, 'padding': 'x' * 100} for i in range(10)})
+        self.db.save('tests/testing_cache.json')
+        self.assertEqual(Node('tests/testing_cache.json').get('5').value(), 5)
+        os.remove('tests/testing_cache.json')
+
+
+def read_shared(snapshot, name):  # Runs in a worker process
+    return attach(snapshot).get(name)()
+
+
+class SharedMemoryTests(unittest.TestCase):
+    def setUp(self):
+        self.db = Node({'a': 1, 'b': {'c': 2}, 'd': [dt(2023, 3, 6)]})
+        self.snapshot = self.db.share()
+
+    def tearDown(self):
+        self.snapshot.close()
+
+    def test_attach_by_name(self):
+        view = attach(self.snapshot.name)
+        self.assertEqual(view.b.c(), 2)
+        self.assertEqual(view(), self.db())
+
+    def test_attach_pickled(self):
+        view = attach(pickle.loads(pickle.dumps(self.snapshot)))
+        self.assertEqual(view.d(), [dt(2023, 3, 6)])
+        self.assertFalse(view.file.data.loaded)
+
+    def test_local_changes(self):
+        view = attach(self.snapshot)
+        view.a = 5
+        self.assertEqual(attach(self.snapshot).a(), 1)
+
+    def test_attach_in_workers(self):
+        with ProcessPoolExecutor(2) as executor:
+            results = list(executor.map(read_shared, [self.snapshot] * 3, ['a', 'b', 'd']))
+        self.assertEqual(results, [1, {'c': 2}, [dt(2023, 3, 6)]])
+
+    def test_share_child(self):
+        with self.db.b.share() as snapshot:
+            self.assertEqual(attach(snapshot)(), {'c': 2})
+
+
+class DiffTests(unittest.TestCase):
+    def setUp(self):
+        self.old = Node({'a': 1, 'b': {'c': 2, 'd': {'e': [3]}}, 'f': 'g'})
+        self.new = Node({'a': 1, 'b': {'c': 5, 'd': {'e': [3]}}, 'h': True})
+
+    def test_diff(self):
+        patch = self.old.diff(self.new)
+        self.assertCountEqual(patch, [(diff.DELETE, ('f',)), (diff.SET, ('b', 'c'), 5), (diff.SET, ('h',), True)])
+        self.assertEqual(self.new.diff(self.new), [])
+        self.assertEqual(self.old.b.d.diff({'e': [3]}), [])
+
+    def test_apply(self):
+        self.old.apply(self.old.diff(self.new))
+        self.assertEqual(self.old(), self.new())
+        self.assertEqual(self.old.diff(self.new), [])
+        self.new.b.d.e().append(4)  # Patches don't share values with the tree they came from
+        self.assertEqual(self.old.b.d.e(), [3])
+
+    def test_apply_child(self):
+        self.old.b.apply([(diff.SET, (), {'x': 1})])
+        self.assertEqual(self.old.b(), {'x': 1})
+
+    def test_compact(self):
+        patch = self.old.diff(self.new)
+        replica = Node(pickle.loads(pickle.dumps(self.old())))
+        replica.apply(diff.dumps(patch))
+        self.assertEqual(replica(), self.new())
+
+    def test_cached_hashes(self):
+        self.old.diff(self.new)
+        cached = self.old.file.hash_node('b', 'd')
+        self.assertIsNotNone(cached.digest)
+        self.old.b.c = 5
+        self.assertIs(self.old.file.hash_node('b', 'd'), cached)  # Unchanged subtrees keep their hashes
+        self.assertIsNone(self.old.file.hash_node('b').digest)
+        self.old.delete('f')
+        self.old.h = True
+        self.assertEqual(self.old.diff(self.new), [])
+        self.new.b.d.e = [4]
+        self.assertEqual(self.old.diff(self.new), [(diff.SET, ('b', 'd', 'e'), [4])])
+
+    def test_changes_in_place(self):
+        self.old.apply(self.old.diff(self.new))
+        self.assertEqual(self.old.diff(self.new), [])
+        self.new.b.d.e().append(4)
+        self.new.b()['c'] = 6
+        self.assertCountEqual(self.old.diff(self.new), [(diff.SET, ('b', 'c'), 6), (diff.SET, ('b', 'd', 'e'), [3, 4])])
+        self.old.apply(self.old.diff(self.new))
+        self.assertEqual(self.old(), self.new())
+        self.new.x = [1]
+        patch = self.old.diff(self.new)
+        patch[0][2].append(2)  # Patches hand out the other tree's values
+        self.assertEqual(self.old.diff(self.new), [(diff.SET, ('x',), [1, 2])])
+
+    def test_replace_data(self):
+        self.old.diff(self.new)
+        self.old.file.data = self.new.file.data.copy()
+        self.assertEqual(self.old.diff(self.new), [])
+
+
 # noinspection PyCallingNonCallable
 class ArithmeticTests(unittest.TestCase):
     def test_iadd_int(self):